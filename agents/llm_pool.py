@@ -0,0 +1,88 @@
+"""
+Shared LLM Clients
+Caches ChatOpenAI instances so agents with the same settings share one client
+"""
+
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+from config import config
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+
+def get_chat_model(
+    model: str,
+    temperature: float,
+    service_tier: Optional[str] = None
+) -> "ChatOpenAI":
+    """
+    Get a shared ChatOpenAI client for the given settings
+    
+    Clients created with the same timeout reuse langchain-openai's pooled
+    httpx connections, so repeated agent construction does not pay for
+    new TCP/TLS connections.
+    
+    Args:
+        model: OpenAI model name
+        temperature: Sampling temperature
+        service_tier: Optional OpenAI service tier (e.g. "flex")
+        
+    Returns:
+        Cached ChatOpenAI instance
+    """
+    # The API key is read at construction, so it is part of the cache key
+    return _build_chat_model(model, temperature, service_tier, os.getenv("OPENAI_API_KEY"))
+
+
+@lru_cache(maxsize=16)
+def _build_chat_model(
+    model: str,
+    temperature: float,
+    service_tier: Optional[str],
+    api_key: Optional[str]
+) -> "ChatOpenAI":
+    """Construct a ChatOpenAI client (cached per settings and API key)"""
+    # Imported on first use: langchain_openai pulls in openai, httpx and
+    # tiktoken, which dominates cold-start time for the CLI and tests
+    from langchain_openai import ChatOpenAI
+    
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        service_tier=service_tier,
+        api_key=api_key,
+        request_timeout=config.llm.LLM_TIMEOUT
+    )
+
+
+def get_embeddings_model(model: str, dimensions: int) -> "OpenAIEmbeddings":
+    """
+    Get a shared OpenAIEmbeddings client for the given settings
+    
+    Args:
+        model: OpenAI embedding model name
+        dimensions: Embedding size to request
+        
+    Returns:
+        Cached OpenAIEmbeddings instance
+    """
+    return _build_embeddings_model(model, dimensions, os.getenv("OPENAI_API_KEY"))
+
+
+@lru_cache(maxsize=4)
+def _build_embeddings_model(
+    model: str,
+    dimensions: int,
+    api_key: Optional[str]
+) -> "OpenAIEmbeddings":
+    """Construct an OpenAIEmbeddings client (cached per settings and API key)"""
+    from langchain_openai import OpenAIEmbeddings
+    
+    return OpenAIEmbeddings(
+        model=model,
+        dimensions=dimensions,
+        api_key=api_key,
+        request_timeout=config.llm.LLM_TIMEOUT
+    )
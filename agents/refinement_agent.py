@@ -3,32 +3,71 @@ Search Refinement Agent
 Dynamically adjusts search strategy based on result quality
 """
 
+import asyncio
 import logging
 import json
-from typing import Dict, List, Any
-from langchain_openai import ChatOpenAI
+import re
+from typing import Dict, List, Any, Tuple
+import orjson
+from cachetools import TTLCache
 from langchain_core.messages import SystemMessage, HumanMessage
+from agents.llm_pool import get_chat_model
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# JSON body of a ```json / ``` fenced block (closing fence optional)
+CODE_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+
 
 class SearchRefinementAgent:
     """Agent for refining search strategies based on results"""
     
+    # Static instructions live in the system prompt so every refinement call
+    # shares the same prefix for provider-side prompt caching; requests carry
+    # only the dynamic payload as JSON
     SYSTEM_PROMPT = """You are a medical search strategy expert. Your job is to analyze search results and suggest refinements to improve result quality.
 
-When results are insufficient, suggest:
-- Broader terms (synonyms, parent categories, common abbreviations)
-- Alternative medical terminology
-- Different clinical perspectives
+Each request is a JSON object with:
+- "task": "broaden", "narrow" or "alternative"
+- "query": the original medical search term
+- "term_type": the type of medical term
+- "search_history": search terms already tried
+- "num_terms": how many new search terms to suggest
+- "total_matches" and "sample_results": current results (narrow only)
+
+BROADEN - no or too few results were found.
+Suggest BROADER medical search terms that might retrieve results.
+Strategies:
+- Use medical synonyms (e.g., "MI" for "myocardial infarction")
+- Try common abbreviations (e.g., "HTN" for "hypertension")
+- Use parent categories (e.g., "diabetes" for "type 2 diabetes")
+- Try simpler lay terms (e.g., "heart attack" for "acute coronary syndrome")
+- Consider related conditions or tests
+
+NARROW - too many results were found.
+Suggest MORE SPECIFIC medical search terms to narrow the results.
+Strategies:
+- Add qualifiers (acute vs chronic, primary vs secondary)
+- Specify type or subtype (Type 1 vs Type 2 diabetes)
+- Add anatomical location (left, right, upper, lower)
+- Specify severity (mild, moderate, severe)
+- Add temporal aspects (new onset, recurrent, chronic)
+
+ALTERNATIVE - several attempts have not found optimal results.
+Suggest ALTERNATIVE medical search approaches that take a completely different angle.
+Strategies:
+- Try related symptoms or presentations
+- Use procedure or treatment names instead of conditions
+- Search by etiology or cause
+- Use clinical presentation terms
+- Try patient-friendly terminology
+- Consider differential diagnoses
+Be creative and think outside the box!
 
-When results are too numerous, suggest:
-- More specific terms
-- Additional qualifiers (type, severity, location)
-- Focused subsets
+IMPORTANT: Avoid terms already in the search history.
 
-Respond in JSON format with:
+Respond ONLY with valid JSON, no additional text:
 {
     "strategy": "broaden|narrow|alternative|sufficient",
     "new_search_terms": ["term1", "term2", "term3"],
@@ -37,10 +76,68 @@ Respond in JSON format with:
 }"""
     
     def __init__(self, model_name: str = None, temperature: float = None):
-        self.llm = ChatOpenAI(
-            model=model_name or config.llm.REFINEMENT_MODEL,
-            temperature=temperature if temperature is not None else config.llm.REFINEMENT_TEMPERATURE
+        self.llm = get_chat_model(
+            model_name or config.llm.REFINEMENT_MODEL,
+            temperature if temperature is not None else config.llm.REFINEMENT_TEMPERATURE
+        )
+        # Built once; the system prompt is a class constant
+        self._system_message = SystemMessage(content=self.SYSTEM_PROMPT)
+        # Parsed LLM refinements keyed on normalized query/term type/history
+        self.cache = TTLCache(
+            maxsize=config.refinement.CACHE_MAX_SIZE,
+            ttl=config.refinement.CACHE_TTL
         )
+        # How often the threshold-selected strategy wins a speculative race
+        self.speculation_stats = {"speculated": 0, "primary_won": 0}
+    
+    def _get_cache_key(
+        self,
+        strategy: str,
+        query: str,
+        term_type: str,
+        search_history: List[str]
+    ) -> Tuple:
+        """Generate cache key for a refinement request"""
+        return (
+            strategy,
+            " ".join(query.lower().split()),
+            term_type,
+            tuple(sorted({h.lower().strip() for h in search_history}))
+        )
+    
+    async def _invoke_cached(self, cache_key: Tuple, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Invoke the LLM for a refinement request, reusing cached results
+        
+        Args:
+            cache_key: Key from _get_cache_key
+            request: Dynamic request payload to send on a cache miss
+            
+        Returns:
+            Copy of the parsed refinement dictionary
+        """
+        if cache_key in self.cache:
+            logger.info(f"Refinement cache hit for {cache_key[0]}: {cache_key[1]}")
+            result = self.cache[cache_key]
+        else:
+            messages = [
+                self._system_message,
+                HumanMessage(content=json.dumps(request))
+            ]
+            
+            response = await self.llm.ainvoke(
+                messages,
+                prompt_cache_key=f"refine:{request['term_type']}"
+            )
+            result = self._parse_json_response(response.content)
+            
+            # Only cache usable suggestions so failures are retried
+            if result.get("new_search_terms"):
+                self.cache[cache_key] = result
+        
+        result = dict(result)
+        result["new_search_terms"] = list(result.get("new_search_terms", []))
+        return result
     
     async def refine_strategy(
         self,
@@ -69,19 +166,8 @@ Respond in JSON format with:
         logger.info(f"Refining search strategy: {total_matches} matches, iteration {iteration}")
         
         # Determine refinement strategy
-        if total_matches < config.refinement.TOO_FEW_RESULTS_THRESHOLD:
-            return await self._broaden_search(
-                original_query, term_type, search_history
-            )
-        elif total_matches > config.refinement.TOO_MANY_RESULTS_THRESHOLD:
-            return await self._narrow_search(
-                original_query, term_type, previous_results, search_history
-            )
-        elif iteration >= config.refinement.ALTERNATIVE_STRATEGY_AFTER_ITERATIONS:
-            return await self._alternative_approach(
-                original_query, term_type, search_history
-            )
-        else:
+        strategy = self._select_strategy(total_matches, iteration)
+        if strategy == "sufficient":
             # Results are acceptable
             return {
                 "strategy": "sufficient",
@@ -89,6 +175,90 @@ Respond in JSON format with:
                 "reasoning": "Result quality is acceptable",
                 "confidence": 0.9
             }
+        
+        runners = {
+            "broaden": lambda: self._broaden_search(
+                original_query, term_type, search_history
+            ),
+            "narrow": lambda: self._narrow_search(
+                original_query, term_type, previous_results, search_history
+            ),
+            "alternative": lambda: self._alternative_approach(
+                original_query, term_type, search_history
+            )
+        }
+        
+        # Near a threshold boundary the neighbouring strategy is just as
+        # plausible, so race both LLM branches instead of paying for the
+        # other one on the next iteration
+        candidates = [strategy]
+        window = config.refinement.SPECULATION_WINDOW
+        for nearby in (total_matches * (1 - window), total_matches * (1 + window)):
+            neighbour = self._select_strategy(nearby, iteration)
+            if neighbour != "sufficient" and neighbour not in candidates:
+                candidates.append(neighbour)
+        
+        if len(candidates) == 1:
+            return await runners[strategy]()
+        
+        return await self._speculate(candidates, runners)
+    
+    def _select_strategy(self, total_matches: float, iteration: int) -> str:
+        """Pick the refinement strategy for a result count"""
+        if total_matches < config.refinement.TOO_FEW_RESULTS_THRESHOLD:
+            return "broaden"
+        elif total_matches > config.refinement.TOO_MANY_RESULTS_THRESHOLD:
+            return "narrow"
+        elif iteration >= config.refinement.ALTERNATIVE_STRATEGY_AFTER_ITERATIONS:
+            return "alternative"
+        return "sufficient"
+    
+    async def _speculate(
+        self,
+        candidates: List[str],
+        runners: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Run candidate strategies concurrently and keep the first useful one
+        
+        Args:
+            candidates: Strategy names, threshold-selected strategy first
+            runners: Strategy name to coroutine factory
+            
+        Returns:
+            First result with new search terms, else the primary result
+        """
+        logger.info(f"Near strategy boundary, speculating on {candidates}")
+        tasks = {
+            asyncio.create_task(runners[name]()): name for name in candidates
+        }
+        primary = next(iter(tasks))
+        pending = set(tasks)
+        self.speculation_stats["speculated"] += 1
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    result = task.result()
+                    if result.get("new_search_terms"):
+                        if task is primary:
+                            self.speculation_stats["primary_won"] += 1
+                        logger.info(
+                            f"Speculative refinement won by {tasks[task]} "
+                            f"(primary won {self.speculation_stats['primary_won']}"
+                            f"/{self.speculation_stats['speculated']})"
+                        )
+                        return result
+            
+            # No branch produced terms; keep the threshold-selected answer
+            self.speculation_stats["primary_won"] += 1
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
     
     async def _broaden_search(
         self,
@@ -98,30 +268,19 @@ Respond in JSON format with:
     ) -> Dict[str, Any]:
         """Generate broader search terms when no results found"""
         
-        prompt = f"""No results found for the medical term: "{query}"
-Term type: {term_type}
-Already tried: {', '.join(search_history) if search_history else 'None'}
-
-Suggest 3-5 BROADER medical search terms that might retrieve results.
-
-Strategies:
-- Use medical synonyms (e.g., "MI" for "myocardial infarction")
-- Try common abbreviations (e.g., "HTN" for "hypertension")
-- Use parent categories (e.g., "diabetes" for "type 2 diabetes")
-- Try simpler lay terms (e.g., "heart attack" for "acute coronary syndrome")
-- Consider related conditions or tests
-
-IMPORTANT: Avoid terms already in the search history.
-Respond ONLY with valid JSON, no additional text."""
+        request = {
+            "task": "broaden",
+            "query": query,
+            "term_type": term_type,
+            "search_history": search_history,
+            "num_terms": "3-5"
+        }
         
         try:
-            messages = [
-                SystemMessage(content=self.SYSTEM_PROMPT),
-                HumanMessage(content=prompt)
-            ]
-            
-            response = await self.llm.ainvoke(messages)
-            result = self._parse_json_response(response.content)
+            result = await self._invoke_cached(
+                self._get_cache_key("broaden", query, term_type, search_history),
+                request
+            )
             
             result["strategy"] = "broaden"
             logger.info(f"Broadening search with terms: {result.get('new_search_terms')}")
@@ -145,33 +304,21 @@ Respond ONLY with valid JSON, no additional text."""
         # Analyze top results to understand common patterns
         sample_results = self._get_sample_results(previous_results, limit=5)
         
-        prompt = f"""Too many results ({previous_results.get('total_matches', 0)}) found for: "{query}"
-Term type: {term_type}
-Already tried: {', '.join(search_history) if search_history else 'None'}
-
-Sample of current results:
-{sample_results}
-
-Suggest 3-5 MORE SPECIFIC medical search terms to narrow the results.
-
-Strategies:
-- Add qualifiers (acute vs chronic, primary vs secondary)
-- Specify type or subtype (Type 1 vs Type 2 diabetes)
-- Add anatomical location (left, right, upper, lower)
-- Specify severity (mild, moderate, severe)
-- Add temporal aspects (new onset, recurrent, chronic)
-
-IMPORTANT: Avoid terms already in the search history.
-Respond ONLY with valid JSON, no additional text."""
+        request = {
+            "task": "narrow",
+            "query": query,
+            "term_type": term_type,
+            "search_history": search_history,
+            "num_terms": "3-5",
+            "total_matches": previous_results.get("total_matches", 0),
+            "sample_results": sample_results
+        }
         
         try:
-            messages = [
-                SystemMessage(content=self.SYSTEM_PROMPT),
-                HumanMessage(content=prompt)
-            ]
-            
-            response = await self.llm.ainvoke(messages)
-            result = self._parse_json_response(response.content)
+            result = await self._invoke_cached(
+                self._get_cache_key("narrow", query, term_type, search_history),
+                request
+            )
             
             result["strategy"] = "narrow"
             logger.info(f"Narrowing search with terms: {result.get('new_search_terms')}")
@@ -190,31 +337,19 @@ Respond ONLY with valid JSON, no additional text."""
     ) -> Dict[str, Any]:
         """Try completely different search approach after multiple iterations"""
         
-        prompt = f"""After {len(search_history)} attempts, still not finding optimal results for: "{query}"
-Term type: {term_type}
-Previously tried: {', '.join(search_history)}
-
-Suggest {config.refinement.NUM_ALTERNATIVE_TERMS} ALTERNATIVE medical search approaches that take a completely different angle.
-
-Strategies:
-- Try related symptoms or presentations
-- Use procedure or treatment names instead of conditions
-- Search by etiology or cause
-- Use clinical presentation terms
-- Try patient-friendly terminology
-- Consider differential diagnoses
-
-Be creative and think outside the box!
-Respond ONLY with valid JSON, no additional text."""
+        request = {
+            "task": "alternative",
+            "query": query,
+            "term_type": term_type,
+            "search_history": search_history,
+            "num_terms": config.refinement.NUM_ALTERNATIVE_TERMS
+        }
         
         try:
-            messages = [
-                SystemMessage(content=self.SYSTEM_PROMPT),
-                HumanMessage(content=prompt)
-            ]
-            
-            response = await self.llm.ainvoke(messages)
-            result = self._parse_json_response(response.content)
+            result = await self._invoke_cached(
+                self._get_cache_key("alternative", query, term_type, search_history),
+                request
+            )
             
             result["strategy"] = "alternative"
             logger.info(f"Alternative approach with terms: {result.get('new_search_terms')}")
@@ -234,24 +369,20 @@ Respond ONLY with valid JSON, no additional text."""
         """Parse JSON from LLM response"""
         try:
             # Extract JSON if wrapped in code blocks
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
+            match = CODE_FENCE_PATTERN.search(content)
+            if match:
+                content = match.group(1).strip()
             
-            result = json.loads(content)
+            result = orjson.loads(content)
             
             # Validate required fields
-            if "new_search_terms" not in result:
-                result["new_search_terms"] = []
-            if "reasoning" not in result:
-                result["reasoning"] = "Generated via LLM"
-            if "confidence" not in result:
-                result["confidence"] = 0.7
+            result.setdefault("new_search_terms", [])
+            result.setdefault("reasoning", "Generated via LLM")
+            result.setdefault("confidence", 0.7)
             
             return result
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON: {e}")
             return {
                 "new_search_terms": [],
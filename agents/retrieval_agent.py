@@ -5,23 +5,53 @@ Searches across multiple Clinical Tables APIs based on term analysis
 
 import asyncio
 import logging
-from typing import Dict, List, Any
-from apis.clinical_tables import ClinicalTablesClient
+from collections import defaultdict
+from itertools import zip_longest
+from typing import Dict, List, Any, Optional, Tuple
+from cachetools import TTLCache
+from apis.clinical_tables import ClinicalTablesClient, _prune_closed_loops
+from config import config
 
 logger = logging.getLogger(__name__)
 
 
+def _row_description(row: Any) -> Optional[str]:
+    """Extract the description from a raw Clinical Tables display row"""
+    if not row:
+        return None
+    if isinstance(row, list):
+        # For datasets like HPO that return [code, description] the
+        # description is the second element; otherwise use the first
+        return row[1] if len(row) > 1 else row[0]
+    if isinstance(row, str):
+        return row
+    return None
+
+
 class RetrievalAgent:
     """Agent for retrieving clinical data from multiple sources"""
     
+    # Cache of structured per-term results (in seconds / entries)
+    RESULT_CACHE_TTL = 3600  # 1 hour
+    RESULT_CACHE_MAX_SIZE = 1024
+    
     def __init__(self, client: ClinicalTablesClient):
         self.client = client
+        # Bound in-flight API calls to stay within rate limits; one semaphore
+        # per event loop, since each is bound to the loop it first waits on
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self.cache = TTLCache(maxsize=self.RESULT_CACHE_MAX_SIZE, ttl=self.RESULT_CACHE_TTL)
+    
+    def _get_cache_key(self, term: str, datasets: List[str], max_results: int) -> Tuple:
+        """Generate cache key for a term search across datasets"""
+        return (" ".join(term.lower().split()), tuple(sorted(datasets)), max_results)
     
     async def retrieve(
         self,
         term: str,
         datasets: List[str],
-        max_results_per_dataset: int = 10
+        max_results_per_dataset: int = 10,
+        refresh: bool = False
     ) -> Dict[str, Any]:
         """
         Retrieve codes and data from multiple datasets
@@ -30,10 +60,16 @@ class RetrievalAgent:
             term: Search term
             datasets: List of dataset names to search
             max_results_per_dataset: Max results per dataset
+            refresh: Bypass cached results for this term
             
         Returns:
             Dictionary with results from all datasets
         """
+        cache_key = self._get_cache_key(term, datasets, max_results_per_dataset)
+        if not refresh and cache_key in self.cache:
+            logger.info(f"Retrieval cache hit for '{term}'")
+            return self.cache[cache_key]
+        
         logger.info(f"Retrieving data for '{term}' from {len(datasets)} datasets")
         
         results = await self.client.search_multiple(
@@ -42,7 +78,18 @@ class RetrievalAgent:
             max_results=max_results_per_dataset
         )
         
-        # Filter and structure results
+        structured = self._structure_results(term, datasets, results)
+        if not any("error" in r for r in results.values()):
+            self.cache[cache_key] = structured
+        return structured
+    
+    def _structure_results(
+        self,
+        term: str,
+        datasets: List[str],
+        results: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Filter raw per-dataset API results and structure them for a term"""
         structured_results = {}
         total_matches = 0
         
@@ -71,22 +118,13 @@ class RetrievalAgent:
         codes = data.get("codes", [])
         raw_data = data.get("data", [])
         
-        for i, code in enumerate(codes):
-            result = {"code": code}
-            
-            # Add description if available
-            if i < len(raw_data) and raw_data[i]:
-                if isinstance(raw_data[i], list):
-                    # For datasets like HPO that return [code, description]
-                    if len(raw_data[i]) > 1:
-                        result["description"] = raw_data[i][1]  # Description is second element
-                    elif len(raw_data[i]) > 0:
-                        result["description"] = raw_data[i][0]  # Fallback to first element
-                elif isinstance(raw_data[i], str):
-                    result["description"] = raw_data[i]
-            
-            result["dataset"] = dataset
-            formatted.append(result)
+        # raw_data may be shorter than codes; missing rows have no description
+        for code, row in zip_longest(codes, raw_data[:len(codes)]):
+            description = _row_description(row)
+            if description is None:
+                formatted.append({"code": code, "dataset": dataset})
+            else:
+                formatted.append({"code": code, "description": description, "dataset": dataset})
         
         return formatted
     
@@ -95,7 +133,10 @@ class RetrievalAgent:
         term: str,
         alternative_terms: List[str],
         datasets: List[str],
-        max_results: int = 10
+        max_results: int = 10,
+        refresh: bool = False,
+        required_datasets: Optional[List[str]] = None,
+        min_results: int = 0
     ) -> Dict[str, Any]:
         """
         Retrieve using the main term and alternative search terms
@@ -105,25 +146,135 @@ class RetrievalAgent:
             alternative_terms: Alternative terms to try
             datasets: Datasets to search
             max_results: Max results per dataset
+            refresh: Bypass cached results for these terms
+            required_datasets: Datasets that are always searched in full; when
+                given, searches of the other datasets are cancelled once the
+                required ones have returned at least min_results matches
+            min_results: Matches from required datasets that make the other
+                datasets unnecessary
             
         Returns:
             Combined results from all search attempts
         """
-        all_terms = [term] + alternative_terms
+        # Drop repeated terms while preserving search order
+        all_terms = list(dict.fromkeys([term] + alternative_terms))
         
-        # Search with all terms in parallel
-        tasks = [
-            self.retrieve(search_term, datasets, max_results)
+        # Reuse cached results for terms searched recently
+        cached: Dict[str, Dict[str, Any]] = {}
+        if not refresh:
+            for search_term in all_terms:
+                cache_key = self._get_cache_key(search_term, datasets, max_results)
+                if cache_key in self.cache:
+                    cached[search_term] = self.cache[cache_key]
+            if cached:
+                logger.info(f"Retrieval cache hit for {len(cached)} of {len(all_terms)} terms")
+        
+        # One task per (term, dataset) pair so every call runs concurrently
+        pairs = [
+            (search_term, dataset)
             for search_term in all_terms
+            if search_term not in cached
+            for dataset in datasets
         ]
+        if required_datasets and min_results > 0:
+            responses = await self._search_with_early_exit(
+                pairs, set(required_datasets), min_results, max_results
+            )
+        else:
+            responses = await asyncio.gather(
+                *[self._search_one(search_term, dataset, max_results) for search_term, dataset in pairs],
+                return_exceptions=True
+            )
         
-        results_list = await asyncio.gather(*tasks)
+        # Group responses back by term; skipped searches leave the term incomplete
+        by_term: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        incomplete = set()
+        for (search_term, dataset), response in zip(pairs, responses):
+            if response is None:
+                incomplete.add(search_term)
+                continue
+            if isinstance(response, Exception):
+                response = {"count": 0, "codes": [], "data": [], "error": str(response)}
+            by_term.setdefault(search_term, {})[dataset] = response
+        
+        results_list = []
+        for search_term in all_terms:
+            if search_term in cached:
+                results_list.append(cached[search_term])
+                continue
+            
+            term_results = by_term.get(search_term, {})
+            structured = self._structure_results(search_term, datasets, term_results)
+            # Only cache complete answers so failed or skipped calls are retried next time
+            if search_term not in incomplete and not any("error" in r for r in term_results.values()):
+                self.cache[self._get_cache_key(search_term, datasets, max_results)] = structured
+            results_list.append(structured)
         
         # Merge results, removing duplicates
         merged_results = self._merge_results(results_list)
         
         return merged_results
     
+    async def _search_with_early_exit(
+        self,
+        pairs: List[Tuple[str, str]],
+        required_datasets: set,
+        min_results: int,
+        max_results: int
+    ) -> List[Any]:
+        """
+        Search all pairs, dropping optional ones once required ones suffice
+        
+        Returns:
+            Response per pair (an exception for failed calls, None for
+            searches cancelled because they were no longer needed)
+        """
+        tasks = [
+            asyncio.create_task(self._search_one(search_term, dataset, max_results))
+            for search_term, dataset in pairs
+        ]
+        required = [task for task, (_, dataset) in zip(tasks, pairs) if dataset in required_datasets]
+        optional = [task for task, (_, dataset) in zip(tasks, pairs) if dataset not in required_datasets]
+        
+        if required and optional:
+            await asyncio.wait(required)
+            found = sum(
+                task.result().get("count", 0)
+                for task in required
+                if task.exception() is None
+            )
+            if found >= min_results:
+                skipped = [task for task in optional if not task.done()]
+                for task in skipped:
+                    task.cancel()
+                if skipped:
+                    logger.info(
+                        f"Required datasets returned {found} matches; "
+                        f"skipping {len(skipped)} optional searches"
+                    )
+        
+        await asyncio.wait(tasks)
+        return [
+            None if task.cancelled() else (task.exception() or task.result())
+            for task in tasks
+        ]
+    
+    async def _search_one(self, term: str, dataset: str, max_results: int) -> Dict[str, Any]:
+        """
+        Search a single dataset, bounded by the concurrency semaphore
+        
+        Transient failures are retried inside the client.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            _prune_closed_loops(self._semaphores)
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(
+                config.api.MAX_CONCURRENT_REQUESTS
+            )
+        async with semaphore:
+            return await self.client.search(dataset, term, max_results)
+    
     def _merge_results(self, results_list: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Merge results from multiple search attempts"""
         if not results_list:
@@ -141,26 +292,29 @@ class RetrievalAgent:
             "results": {}
         }
         
-        seen_codes = set()
+        seen_by_dataset = defaultdict(set)
         
         for result_set in results_list:
             for dataset, dataset_results in result_set.get("results", {}).items():
-                if dataset not in merged["results"]:
-                    merged["results"][dataset] = {
-                        "count": 0,
-                        "results": []
-                    }
+                target = merged["results"].setdefault(dataset, {
+                    "count": 0,
+                    "results": []
+                })
+                seen = seen_by_dataset[dataset]
+                added = 0
                 
                 # Add unique results
                 for item in dataset_results.get("results", []):
                     code = item.get("code")
-                    key = f"{dataset}:{code}"
                     
-                    if key not in seen_codes:
-                        seen_codes.add(key)
-                        merged["results"][dataset]["results"].append(item)
-                        merged["results"][dataset]["count"] += 1
-                        merged["total_matches"] += 1
+                    if code not in seen:
+                        seen.add(code)
+                        # Copy so scoring never mutates cached retrieval results
+                        target["results"].append(dict(item))
+                        added += 1
+                
+                target["count"] += added
+                merged["total_matches"] += added
         
         merged["datasets_with_results"] = len(merged["results"])
         
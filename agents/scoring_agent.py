@@ -3,23 +3,82 @@ Result Scoring Agent
 Scores medical code results for relevance to original query
 """
 
+import asyncio
+import heapq
 import logging
-from typing import Dict, List, Any
+import re
+from typing import Dict, List, Any, Optional, Tuple
 from difflib import SequenceMatcher
-from langchain_openai import ChatOpenAI
+import orjson
 from langchain_core.messages import SystemMessage, HumanMessage
+from agents.llm_pool import get_chat_model
 from config import config
 
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # Fall back to difflib when rapidfuzz is unavailable
+    fuzz = None
+    process = None
+
 logger = logging.getLogger(__name__)
 
+# Common stopwords ignored when matching query terms
+STOPWORDS = frozenset({"a", "an", "the", "is", "are", "was", "were", "of", "for", "in", "on", "at"})
+
+# Relevance score embedded in an LLM response
+SCORE_PATTERN = re.compile(r'0?\.\d+|1\.0')
+
+# Dataset groups used for code specificity heuristics
+ICD_DATASETS = frozenset({"icd10cm", "icd9cm_dx", "icd9cm_sg"})
+MEDICATION_DATASETS = frozenset({"rxterms", "drugs"})
+
+# Placeholder descriptions that carry no information
+PLACEHOLDER_DESCRIPTIONS = frozenset({"N/A", "No description", "No description available"})
+
+# Medical terms that indicate a descriptive, clinically meaningful description
+MEDICAL_TERMS = (
+    "blood", "test", "diabetes", "chronic", "acute", "syndrome",
+    "disease", "disorder", "condition", "procedure", "treatment"
+)
+# Single-pass multi-term scan instead of one substring search per term
+MEDICAL_TERMS_PATTERN = re.compile("|".join(re.escape(term) for term in MEDICAL_TERMS))
+
 
 class ResultScoringAgent:
     """Agent for scoring result relevance"""
     
-    def __init__(self, model_name: str = None, temperature: float = None):
-        self.llm = ChatOpenAI(
-            model=model_name or config.llm.SCORING_MODEL,
-            temperature=temperature if temperature is not None else config.llm.SCORING_TEMPERATURE
+    # Descriptions longer than this skip text similarity (scored as 0.0)
+    MAX_SIMILARITY_LENGTH = 1000
+    
+    # Maximum codes rated per LLM relevance prompt
+    LLM_RELEVANCE_BATCH_SIZE = 20
+    
+    LLM_RELEVANCE_SCORING_GUIDE = """Scoring guide:
+1.0 = Perfect match (exact intent)
+0.8 = Very relevant (directly related)
+0.6 = Relevant (related but not exact)
+0.4 = Somewhat relevant (tangentially related)
+0.2 = Barely relevant (weak connection)
+0.0 = Not relevant (unrelated)
+
+Consider:
+- Does it match the clinical intent?
+- Is it the right type of code?
+- Is it too broad or too specific?
+- Would a clinician find this useful?"""
+    
+    def __init__(
+        self,
+        model_name: str = None,
+        temperature: float = None,
+        service_tier: str = None
+    ):
+        # LLM relevance checks are bulk work that tolerates latency, so they
+        # can run on a cheaper tier such as OpenAI Flex processing
+        self.llm = get_chat_model(
+            model_name or config.llm.SCORING_MODEL,
+            temperature if temperature is not None else config.llm.SCORING_TEMPERATURE,
+            service_tier or config.llm.SCORING_SERVICE_TIER
         )
     
     async def score_results(
@@ -45,45 +104,84 @@ class ResultScoringAgent:
         term_type = term_analysis.get("term_type", "unknown")
         primary_datasets = term_analysis.get("primary_datasets", [])
         
-        # Score results in each dataset
-        for dataset, data in scored_results.get("results", {}).items():
-            scored_items = []
-            
-            # Process in batches to avoid overwhelming the LLM
-            items = data.get("results", [])
+        dataset_results = scored_results.get("results", {})
+        
+        # Extract flat columns once so scoring runs over parallel lists
+        # instead of re-reading each result dict per factor
+        rows = [
+            (dataset, item)
+            for dataset, data in dataset_results.items()
+            for item in data.get("results", [])
+        ]
+        codes = [item.get("code", "") for _, item in rows]
+        descriptions = [item.get("description", "") for _, item in rows]
+        lowered = [description.lower() for description in descriptions]
+        
+        # Compute text similarity for every description in one batch
+        similarities = self._batch_text_similarity(query.lower(), lowered)
+        
+        # Tokenize the query once rather than per result
+        query_words = self._query_words(query)
+        query_prefixes = tuple(word[:4] for word in query_words)
+        
+        # Dataset appropriateness depends only on the dataset
+        dataset_scores = {
+            dataset: self._dataset_appropriateness(dataset, primary_datasets)
+            for dataset in dataset_results
+        }
+        
+        # Deterministic scoring is pure CPU work, so it runs in a tight
+        # synchronous loop rather than awaiting a coroutine per item
+        for (dataset, item), code, description, desc_lower, text_sim in zip(
+            rows, codes, descriptions, lowered, similarities
+        ):
+            score = self._score_single_result(
+                query=query,
+                code=code,
+                description=description,
+                dataset=dataset,
+                term_type=term_type,
+                primary_datasets=primary_datasets,
+                text_sim=text_sim,
+                query_words=query_words,
+                query_prefixes=query_prefixes,
+                desc_lower=desc_lower,
+                dataset_score=dataset_scores[dataset]
+            )
             
-            for item in items:
-                score = await self._score_single_result(
-                    query=query,
-                    code=item.get("code", ""),
-                    description=item.get("description", ""),
-                    dataset=dataset,
-                    term_type=term_type,
-                    primary_datasets=primary_datasets
-                )
-                
-                item["relevance_score"] = score
-                item["relevance_level"] = self._score_to_level(score)
-                scored_items.append(item)
-            
-            # Sort by relevance
-            scored_items.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
-            scored_results["results"][dataset]["results"] = scored_items
-        
-        # Calculate overall quality metrics
-        all_scores = []
-        for data in scored_results.get("results", {}).values():
-            all_scores.extend([
-                item.get("relevance_score", 0) 
-                for item in data.get("results", [])
-            ])
+            item["relevance_score"] = score
+            item["relevance_level"] = self._score_to_level(score)
         
-        if all_scores:
+        # Sort each dataset by relevance
+        for data in dataset_results.values():
+            scored_items = data.get("results", [])
+            scored_items.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
+            data["results"] = scored_items
+        
+        # Calculate overall quality metrics in a single pass
+        total = 0.0
+        count = 0
+        min_score = 1.0
+        max_score = 0.0
+        high_quality_count = 0
+        for data in dataset_results.values():
+            for item in data.get("results", []):
+                score = item.get("relevance_score", 0)
+                total += score
+                count += 1
+                if score < min_score:
+                    min_score = score
+                if score > max_score:
+                    max_score = score
+                if score >= 0.7:
+                    high_quality_count += 1
+        
+        if count:
             scored_results["quality_metrics"] = {
-                "avg_relevance": sum(all_scores) / len(all_scores),
-                "max_relevance": max(all_scores),
-                "min_relevance": min(all_scores),
-                "high_quality_count": len([s for s in all_scores if s >= 0.7])
+                "avg_relevance": total / count,
+                "max_relevance": max_score,
+                "min_relevance": min_score,
+                "high_quality_count": high_quality_count
             }
         else:
             scored_results["quality_metrics"] = {
@@ -97,50 +195,84 @@ class ResultScoringAgent:
         
         return scored_results
     
-    async def _score_single_result(
+    def _score_single_result(
         self,
         query: str,
         code: str,
         description: str,
         dataset: str,
         term_type: str,
-        primary_datasets: List[str]
+        primary_datasets: List[str],
+        text_sim: Optional[float] = None,
+        query_words: Optional[List[str]] = None,
+        query_prefixes: Optional[Tuple[str, ...]] = None,
+        desc_lower: Optional[str] = None,
+        dataset_score: Optional[float] = None
     ) -> float:
         """
         Score a single result using multiple factors
         
+        Args:
+            text_sim: Precomputed query/description similarity, if available
+            query_words: Precomputed query tokens, if available
+            query_prefixes: Precomputed 4-char prefixes of query_words
+            desc_lower: Precomputed lowercase description
+            dataset_score: Precomputed weighted dataset appropriateness
+        
         Returns:
             Relevance score between 0.0 and 1.0
         """
+        if query_words is None:
+            query_words = self._query_words(query)
+        if dataset_score is None:
+            dataset_score = self._dataset_appropriateness(dataset, primary_datasets)
+        
+        # Without a description, text similarity, description quality and
+        # query term presence all score zero; only dataset and code count
+        if not description and query_words:
+            score = dataset_score
+            score += self._code_specificity(code, dataset) * config.scoring.CODE_SPECIFICITY_WEIGHT
+            return min(1.0, max(0.0, score))
+        
+        if desc_lower is None:
+            desc_lower = description.lower()
+        
         score = 0.0
         
         # Factor 1: Text similarity
-        text_sim = self._text_similarity(query.lower(), description.lower())
+        if text_sim is None:
+            text_sim = self._text_similarity(query.lower(), desc_lower)
         score += text_sim * config.scoring.TEXT_SIMILARITY_WEIGHT
         
         # Factor 2: Dataset appropriateness
-        dataset_score = config.scoring.DATASET_APPROPRIATENESS_WEIGHT
-        if dataset in primary_datasets:
-            score += dataset_score
-        elif dataset in [d.replace("_", "") for d in primary_datasets]:
-            score += dataset_score * 0.75
-        else:
-            score += dataset_score * 0.25
+        score += dataset_score
         
         # Factor 3: Code specificity
         specificity = self._code_specificity(code, dataset)
         score += specificity * config.scoring.CODE_SPECIFICITY_WEIGHT
         
         # Factor 4: Description quality
-        desc_quality = self._description_quality(description)
+        desc_quality = self._description_quality(description, desc_lower)
         score += desc_quality * config.scoring.DESCRIPTION_QUALITY_WEIGHT
         
         # Factor 5: Query term presence
-        term_presence = self._query_term_presence(query, description)
+        term_presence = self._query_term_presence(
+            query, description, query_words, query_prefixes, desc_lower
+        )
         score += term_presence * config.scoring.QUERY_TERM_PRESENCE_WEIGHT
         
         return min(1.0, max(0.0, score))
     
+    def _dataset_appropriateness(self, dataset: str, primary_datasets: List[str]) -> float:
+        """Weighted score for how well the dataset fits the term type"""
+        dataset_score = config.scoring.DATASET_APPROPRIATENESS_WEIGHT
+        if dataset in primary_datasets:
+            return dataset_score
+        elif dataset in [d.replace("_", "") for d in primary_datasets]:
+            return dataset_score * 0.75
+        else:
+            return dataset_score * 0.25
+    
     async def _llm_relevance_check(
         self,
         query: str,
@@ -154,31 +286,60 @@ class ResultScoringAgent:
         Returns:
             Relevance score between 0.0 and 1.0
         """
-        prompt = f"""Rate the relevance of this medical code to the user's query.
+        scores = await self._llm_relevance_check_batch(
+            query, [{"code": code, "description": description}], term_type
+        )
+        return scores[0]
+    
+    async def _llm_relevance_check_batch(
+        self,
+        query: str,
+        items: List[Dict[str, Any]],
+        term_type: str
+    ) -> List[float]:
+        """
+        Use LLM to judge relevance of many codes with one call per batch
+        
+        Args:
+            query: Original user query
+            items: Results with code and description
+            term_type: Expected term type
+            
+        Returns:
+            Relevance scores between 0.0 and 1.0, in item order
+        """
+        batch_size = self.LLM_RELEVANCE_BATCH_SIZE
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        
+        batch_scores = await asyncio.gather(*[
+            self._score_relevance_batch(query, batch, term_type) for batch in batches
+        ])
+        return [score for scores in batch_scores for score in scores]
+    
+    async def _score_relevance_batch(
+        self,
+        query: str,
+        items: List[Dict[str, Any]],
+        term_type: str
+    ) -> List[float]:
+        """Score one batch in a single prompt, falling back to per-item calls"""
+        codes = [
+            {"code": item.get("code", ""), "description": item.get("description", "")}
+            for item in items
+        ]
+        prompt = f"""Rate the relevance of each medical code to the user's query.
 
 User query: "{query}"
 Expected term type: {term_type}
 
-Medical code: {code}
-Description: {description}
+Medical codes (JSON array):
+{orjson.dumps(codes).decode()}
 
-On a scale of 0.0 to 1.0, how relevant is this code?
+On a scale of 0.0 to 1.0, how relevant is each code?
 
-Scoring guide:
-1.0 = Perfect match (exact intent)
-0.8 = Very relevant (directly related)
-0.6 = Relevant (related but not exact)
-0.4 = Somewhat relevant (tangentially related)
-0.2 = Barely relevant (weak connection)
-0.0 = Not relevant (unrelated)
-
-Consider:
-- Does it match the clinical intent?
-- Is it the right type of code?
-- Is it too broad or too specific?
-- Would a clinician find this useful?
+{self.LLM_RELEVANCE_SCORING_GUIDE}
 
-Respond with ONLY a number between 0.0 and 1.0, nothing else."""
+Respond with ONLY a JSON array of {len(codes)} numbers between 0.0 and 1.0, one per code in the same order, nothing else."""
         
         try:
             messages = [
@@ -187,25 +348,72 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
             ]
             
             response = await self.llm.ainvoke(messages)
-            score_str = response.content.strip()
-            
-            # Extract number from response
-            import re
-            match = re.search(r'0?\.\d+|1\.0', score_str)
-            if match:
-                return float(match.group())
-            
-            # Try to parse as float directly
-            return max(0.0, min(1.0, float(score_str)))
+            scores = orjson.loads(response.content.strip())
+            if isinstance(scores, (int, float)):
+                scores = [scores]  # Bare number for a single code
+            if isinstance(scores, list) and len(scores) == len(codes):
+                return [max(0.0, min(1.0, float(score))) for score in scores]
+            logger.warning(f"LLM returned {len(scores) if isinstance(scores, list) else 'no'} scores for {len(codes)} codes")
             
+        except (orjson.JSONDecodeError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to parse batch relevance scores: {e}")
         except Exception as e:
             logger.warning(f"LLM relevance check failed: {e}")
-            return 0.5  # Neutral score on error
+            return [0.5] * len(codes)  # Neutral score on error
+        
+        if len(codes) == 1:
+            return [self._parse_relevance_score(response.content)]
+        
+        # Blast radius of a malformed batch is limited to re-scoring it per item
+        return await asyncio.gather(*[
+            self._llm_relevance_check(query, code["code"], code["description"], term_type)
+            for code in codes
+        ])
+    
+    def _parse_relevance_score(self, content: str) -> float:
+        """Parse a 0.0-1.0 relevance score from an LLM response"""
+        score_str = content.strip()
+        
+        # Fast path: the response is just the number as requested
+        try:
+            return max(0.0, min(1.0, float(score_str)))
+        except ValueError:
+            pass
+        
+        # Extract number from surrounding text
+        match = SCORE_PATTERN.search(score_str)
+        return float(match.group()) if match else 0.5
     
     def _text_similarity(self, text1: str, text2: str) -> float:
-        """Calculate text similarity using SequenceMatcher"""
+        """Calculate text similarity using RapidFuzz (SequenceMatcher fallback)"""
+        # Very long descriptions are left to query term presence
+        if len(text2) > self.MAX_SIMILARITY_LENGTH:
+            return 0.0
+        if fuzz is not None:
+            return fuzz.ratio(text1, text2) / 100.0
         return SequenceMatcher(None, text1, text2).ratio()
     
+    def _batch_text_similarity(self, query: str, descriptions: List[str]) -> List[float]:
+        """
+        Calculate similarity of one query against many descriptions
+        
+        Uses a single RapidFuzz extract call when available instead of
+        scoring each pair separately.
+        """
+        if not descriptions:
+            return []
+        
+        if process is not None:
+            similarities = [0.0] * len(descriptions)
+            for _, value, index in process.extract(
+                query, descriptions, scorer=fuzz.ratio, processor=None, limit=None
+            ):
+                if len(descriptions[index]) <= self.MAX_SIMILARITY_LENGTH:
+                    similarities[index] = value / 100.0
+            return similarities
+        
+        return [self._text_similarity(query, desc) for desc in descriptions]
+    
     def _code_specificity(self, code: str, dataset: str) -> float:
         """
         Estimate code specificity based on structure
@@ -219,11 +427,11 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
             return 0.3
         
         # ICD codes: more digits = more specific
-        if dataset in ["icd10cm", "icd9cm_dx", "icd9cm_sg"]:
+        if dataset in ICD_DATASETS:
             # E11.9 (less specific) vs E11.3211 (more specific)
-            parts = code.split(".")
-            if len(parts) > 1:
-                decimal_digits = len(parts[1])
+            _, dot, decimals = code.partition(".")
+            if dot:
+                decimal_digits = len(decimals.partition(".")[0])
                 return min(1.0, 0.5 + (decimal_digits * 0.15))
             return 0.5
         
@@ -233,7 +441,7 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
             return min(1.0, 0.4 + (len(code) * 0.02))
         
         # RxTerms: combination drugs are more specific
-        elif dataset in ["rxterms", "drugs"]:
+        elif dataset in MEDICATION_DATASETS:
             if "/" in code or "+" in code:
                 return 0.8  # Combination drug
             return 0.6
@@ -241,7 +449,7 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
         # Default
         return 0.6
     
-    def _description_quality(self, description: str) -> float:
+    def _description_quality(self, description: str, desc_lower: Optional[str] = None) -> float:
         """
         Assess description quality
         
@@ -250,10 +458,11 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
         - Contain medical terminology
         - Are not generic placeholders
         """
-        if not description or description in ["N/A", "No description", "No description available"]:
+        if not description or description in PLACEHOLDER_DESCRIPTIONS:
             return 0.0
         
-        desc_lower = description.lower()
+        if desc_lower is None:
+            desc_lower = description.lower()
         
         # Check for generic/placeholder descriptions
         if len(description) < 10:
@@ -266,14 +475,24 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
             quality = 0.5
         
         # Bonus for medical terms
-        medical_terms = ["blood", "test", "diabetes", "chronic", "acute", "syndrome", 
-                        "disease", "disorder", "condition", "procedure", "treatment"]
-        if any(term in desc_lower for term in medical_terms):
+        if MEDICAL_TERMS_PATTERN.search(desc_lower):
             quality += 0.2
         
         return min(1.0, quality)
     
-    def _query_term_presence(self, query: str, description: str) -> float:
+    def _query_words(self, query: str) -> List[str]:
+        """Tokenize a query into significant lowercase words"""
+        # Remove common stopwords
+        return [w for w in query.lower().split() if w not in STOPWORDS and len(w) > 2]
+    
+    def _query_term_presence(
+        self,
+        query: str,
+        description: str,
+        query_words: Optional[List[str]] = None,
+        query_prefixes: Optional[Tuple[str, ...]] = None,
+        desc_lower: Optional[str] = None
+    ) -> float:
         """
         Check how many query terms appear in description
         
@@ -281,12 +500,12 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
             Ratio of query words found in description (0.0 to 1.0)
         """
         # Normalize and tokenize
-        query_lower = query.lower()
-        desc_lower = description.lower()
-        
-        # Remove common stopwords
-        stopwords = {"a", "an", "the", "is", "are", "was", "were", "of", "for", "in", "on", "at"}
-        query_words = [w for w in query_lower.split() if w not in stopwords and len(w) > 2]
+        if desc_lower is None:
+            desc_lower = description.lower()
+        if query_words is None:
+            query_words = self._query_words(query)
+        if query_prefixes is None:
+            query_prefixes = tuple(word[:4] for word in query_words)
         
         if not query_words:
             return 0.5
@@ -294,9 +513,10 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
         # Count matches
         matches = sum(1 for word in query_words if word in desc_lower)
         
-        # Also check for partial matches (e.g., "diabetes" in "diabetic")
-        partial_matches = sum(1 for word in query_words 
-                             if any(word[:4] in desc_word for desc_word in desc_lower.split()))
+        # Also check for partial matches (e.g., "diabetes" in "diabetic").
+        # A 4-char prefix has no whitespace, so it occurs inside some
+        # description word exactly when it occurs in the description.
+        partial_matches = sum(1 for prefix in query_prefixes if prefix in desc_lower)
         
         total_score = (matches + partial_matches * 0.5) / len(query_words)
         
@@ -328,13 +548,13 @@ Respond with ONLY a number between 0.0 and 1.0, nothing else."""
         Returns:
             List of top results sorted by relevance
         """
-        all_results = []
-        
-        for dataset, data in scored_results.get("results", {}).items():
-            for item in data.get("results", []):
-                all_results.append(item)
-        
-        # Sort by relevance score
-        all_results.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
+        all_results = (
+            item
+            for data in scored_results.get("results", {}).values()
+            for item in data.get("results", [])
+        )
         
-        return all_results[:top_n]
+        # Partial selection by relevance score; ties keep dataset order
+        return heapq.nlargest(
+            top_n, all_results, key=lambda x: x.get("relevance_score", 0)
+        )
@@ -3,19 +3,56 @@ Synthesis Agent
 Generates intelligent summaries and clinical insights from search results
 """
 
+import asyncio
+import heapq
 import logging
-import json
-from typing import Dict, List, Any
-from langchain_openai import ChatOpenAI
+import operator
+import re
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Any, Optional
+import orjson
 from langchain_core.messages import SystemMessage, HumanMessage
+from agents.llm_pool import get_chat_model
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Bracketed text with repeated brackets, e.g. [[ICD10CM]]
+BRACKETED_PATTERN = re.compile(r"\[+([^\[\]]+)\]+")
+
+# Top-level text fields surfaced while a synthesis streams, in schema order
+STREAMED_FIELD_PATTERNS = {
+    field: re.compile(rf'"{field}"\s*:\s*"((?:[^"\\]|\\.)*)"')
+    for field in (
+        "executive_summary", "clinical_context",
+        "search_quality", "search_quality_explanation"
+    )
+}
+
+# Official coding systems ranked ahead of general databases
+PRIMARY_SYSTEMS = frozenset({
+    "icd10cm", "icd11", "icd9cm_dx", "icd9cm_sg",  # Diagnosis/procedure codes (highest priority)
+    "loinc",  # Lab tests
+    "rxterms", "drugs",  # Medications
+    "hcpcs",  # Procedures/services
+    "hpo",  # Phenotypes (important for genetics)
+    "clinvar", "genes", "snps",  # Genomics
+    "pharmvar",  # Pharmacogenomics
+    "npi_idv", "npi_org"  # Providers
+})
+
+# Ranking-only score boost for primary coding systems
+PRIMARY_SYSTEM_BOOST = 0.15
+
 
 class SynthesisAgent:
     """Agent for synthesizing insights from medical code results"""
     
+    __slots__ = ("llm", "_system_message", "_last_prewarm", "_prewarm_tasks")
+    
+    # Bump whenever SYSTEM_PROMPT changes so cached prefixes are not reused
+    SYSTEM_PROMPT_VERSION = 1
+    
     SYSTEM_PROMPT = """You are a medical informatics expert who synthesizes clinical coding results into actionable insights.
 
 Your job is to analyze medical code search results and provide:
@@ -53,18 +90,142 @@ X [CONDITIONS] 364   (Avoid in top recommendations - use ICD codes instead)
 Be concise, accurate, and clinically relevant.
 Respond in JSON format with structured insights."""
     
+    # Byte-identical across requests; the per-query details follow it
+    STATIC_INSTRUCTIONS = """Analyze the medical coding search results below and provide clinical insights.
+
+Provide a comprehensive analysis in JSON format with:
+
+{
+    "executive_summary": "2-3 sentence overview of findings",
+    "key_patterns": [
+        "Notable pattern 1",
+        "Notable pattern 2"
+    ],
+    "top_recommendations": [
+        {
+            "code": "just the code value (e.g., 'J44.9' or 'metFORMIN (Oral Pill)') - do NOT include the dataset name",
+            "system": "just the dataset name WITHOUT brackets (e.g., 'ICD10CM' or 'RXTERMS')",
+            "use_case": "when to use this code",
+            "confidence": "high|medium|low"
+        }
+    ],
+    "clinical_context": "Important clinical considerations, warnings, or context",
+    "search_quality": "excellent|good|fair|poor",
+    "search_quality_explanation": "why this quality rating",
+    "next_steps": [
+        "Suggested action 1",
+        "Suggested action 2"
+    ]
+}
+
+IMPORTANT: Include ALL codes with relevance score >= 0.7 in top_recommendations.
+Be specific, accurate, and clinically useful."""
+    
+    # Strict structured output mirroring the schema in STATIC_INSTRUCTIONS
+    SYNTHESIS_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "executive_summary": {"type": "string"},
+            "key_patterns": {"type": "array", "items": {"type": "string"}},
+            "top_recommendations": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "code": {"type": "string"},
+                        "system": {"type": "string"},
+                        "use_case": {"type": "string"},
+                        "confidence": {"type": "string", "enum": ["high", "medium", "low"]}
+                    },
+                    "required": ["code", "system", "use_case", "confidence"],
+                    "additionalProperties": False
+                }
+            },
+            "clinical_context": {"type": "string"},
+            "search_quality": {"type": "string", "enum": ["excellent", "good", "fair", "poor"]},
+            "search_quality_explanation": {"type": "string"},
+            "next_steps": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": [
+            "executive_summary", "key_patterns", "top_recommendations",
+            "clinical_context", "search_quality", "search_quality_explanation",
+            "next_steps"
+        ],
+        "additionalProperties": False
+    }
+    
+    RESPONSE_FORMAT = {
+        "type": "json_schema",
+        "json_schema": {"name": "synthesis", "strict": True, "schema": SYNTHESIS_SCHEMA}
+    }
+    
+    # Provider prompt caches stay warm for a few minutes after a request
+    PREWARM_INTERVAL = 300  # seconds
+    
     def __init__(self, model_name: str = None, temperature: float = None):
-        self.llm = ChatOpenAI(
-            model=model_name or config.llm.SYNTHESIS_MODEL,
-            temperature=temperature if temperature is not None else config.llm.SYNTHESIS_TEMPERATURE
+        self.llm = get_chat_model(
+            model_name or config.llm.SYNTHESIS_MODEL,
+            temperature if temperature is not None else config.llm.SYNTHESIS_TEMPERATURE
         )
+        # Built once; the system prompt is a class constant
+        self._system_message = SystemMessage(content=self.SYSTEM_PROMPT)
+        self._last_prewarm = None
+        self._prewarm_tasks = set()
+    
+    def prepare_speculative(self, query: str) -> Optional[asyncio.Task]:
+        """
+        Warm the provider prompt cache for synthesis while retrieval runs
+        
+        Sends the static synthesis prefix, with the same response_format as
+        the real call (the provider folds the schema into the prompt prefix),
+        and a one-token budget so the real synthesis call reuses a cached
+        prefill. Each warm-up is a billed request, so this is off unless
+        SYNTHESIS_PREWARM is set. Must be called from a running event loop.
+        
+        Args:
+            query: User query the upcoming synthesis is for
+            
+        Returns:
+            Background task, or None if the cache was warmed recently
+        """
+        now = time.monotonic()
+        if self._last_prewarm is not None and now - self._last_prewarm < self.PREWARM_INTERVAL:
+            return None
+        self._last_prewarm = now
+        
+        task = asyncio.create_task(self._prewarm(query))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._prewarm_tasks.add(task)
+        task.add_done_callback(self._prewarm_tasks.discard)
+        return task
+    
+    async def _prewarm(self, query: str) -> None:
+        """Issue the prompt cache warm-up request"""
+        messages = [
+            self._system_message,
+            HumanMessage(
+                content=self.STATIC_INSTRUCTIONS + "\n\n---\n\n" + f'**User Query:** "{query}"'
+            )
+        ]
+        try:
+            await self.llm.ainvoke(
+                messages,
+                prompt_cache_key=f"synthesis:v{self.SYSTEM_PROMPT_VERSION}",
+                response_format=self.RESPONSE_FORMAT,
+                max_tokens=1
+            )
+            logger.debug(f"Synthesis prompt cache warmed for query: {query}")
+        except Exception as e:
+            # A truncated or failed warm-up only costs the cache benefit
+            logger.debug(f"Synthesis prompt cache warm-up failed: {e}")
     
     async def synthesize_findings(
         self,
         query: str,
         scored_results: Dict[str, Any],
         term_analysis: Dict[str, Any],
-        iteration_history: List[Dict[str, Any]]
+        iteration_history: List[Dict[str, Any]],
+        on_update: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         Generate comprehensive synthesis of search results
@@ -74,10 +235,42 @@ Respond in JSON format with structured insights."""
             scored_results: Results with relevance scores
             term_analysis: Analysis from terminology agent
             iteration_history: History of search iterations
+            on_update: Optional async callback awaited with each partial
+                synthesis as it streams, so callers can render early
             
         Returns:
             Dictionary with synthesis insights
         """
+        synthesis = {}
+        async for synthesis in self.synthesize_findings_stream(
+            query, scored_results, term_analysis, iteration_history
+        ):
+            if on_update is not None:
+                await on_update(synthesis)
+        return synthesis
+    
+    async def synthesize_findings_stream(
+        self,
+        query: str,
+        scored_results: Dict[str, Any],
+        term_analysis: Dict[str, Any],
+        iteration_history: List[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a synthesis as the LLM generates it
+        
+        Yields a partial synthesis each time another top-level text field
+        (executive summary first) is complete, then the full synthesis.
+        
+        Args:
+            query: Original user query
+            scored_results: Results with relevance scores
+            term_analysis: Analysis from terminology agent
+            iteration_history: History of search iterations
+            
+        Yields:
+            Partial synthesis dictionaries; the last one is complete
+        """
         logger.info(f"Synthesizing findings for query: {query}")
         
         # Get quality metrics
@@ -107,12 +300,37 @@ Respond in JSON format with structured insights."""
         
         try:
             messages = [
-                SystemMessage(content=self.SYSTEM_PROMPT),
+                self._system_message,
                 HumanMessage(content=prompt)
             ]
             
-            response = await self.llm.ainvoke(messages)
-            synthesis = self._parse_synthesis_response(response.content)
+            # Route every synthesis call to the same provider cache shard so the
+            # static system prompt prefix is reused across queries
+            chunks = []
+            partial = {}
+            async for chunk in self.llm.astream(
+                messages,
+                prompt_cache_key=f"synthesis:v{self.SYSTEM_PROMPT_VERSION}",
+                response_format=self.RESPONSE_FORMAT
+            ):
+                chunks.append(chunk.content)
+                if '"' not in chunk.content or len(partial) == len(STREAMED_FIELD_PATTERNS):
+                    continue
+                
+                # Surface text fields as soon as their closing quote arrives
+                buffer = "".join(chunks)
+                updated = False
+                for field, pattern in STREAMED_FIELD_PATTERNS.items():
+                    if field not in partial:
+                        match = pattern.search(buffer)
+                        if match:
+                            value = orjson.loads(f'"{match.group(1)}"')
+                            partial[field] = BRACKETED_PATTERN.sub(r"[\1]", value)
+                            updated = True
+                if updated:
+                    yield dict(partial)
+            
+            synthesis = self._parse_synthesis_response("".join(chunks))
             
             # Add metadata
             synthesis["query"] = query
@@ -121,11 +339,49 @@ Respond in JSON format with structured insights."""
             synthesis["avg_relevance_score"] = quality_metrics.get("avg_relevance", 0.0)
             
             logger.info("Synthesis complete")
-            return synthesis
+            yield synthesis
             
         except Exception as e:
             logger.error(f"Error in synthesis: {e}")
-            return self._fallback_synthesis(query, scored_results, term_analysis)
+            yield self._fallback_synthesis(query, scored_results, term_analysis)
+    
+    async def synthesize_batch(
+        self,
+        requests: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Synthesize findings for several queries concurrently
+        
+        Args:
+            requests: Keyword arguments for synthesize_findings, one dict per
+                query (query, scored_results, term_analysis, iteration_history)
+            
+        Returns:
+            Synthesis dictionaries in request order
+        """
+        semaphore = asyncio.Semaphore(config.llm.MAX_CONCURRENCY or 8)
+        
+        async def synthesize_one(request: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.synthesize_findings(**request)
+        
+        results = await asyncio.gather(
+            *[synthesize_one(request) for request in requests],
+            return_exceptions=True
+        )
+        
+        syntheses = []
+        for request, result in zip(requests, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error in batch synthesis for '{request.get('query')}': {result}")
+                result = self._fallback_synthesis(
+                    request.get("query", ""),
+                    request.get("scored_results", {}),
+                    request.get("term_analysis", {})
+                )
+            syntheses.append(result)
+        
+        return syntheses
     
     def _build_synthesis_prompt(
         self,
@@ -141,9 +397,7 @@ Respond in JSON format with structured insights."""
         # Format top results
         results_summary = self._format_results_for_prompt(top_results)
         
-        prompt = f"""Analyze these medical coding search results and provide clinical insights.
-
-**User Query:** "{query}"
+        dynamic_tail = f"""**User Query:** "{query}"
 **Term Type:** {term_type}
 **Total Codes Found:** {total_matches}
 **Average Relevance:** {quality_metrics.get('avg_relevance', 0):.2f}
@@ -151,111 +405,45 @@ Respond in JSON format with structured insights."""
 **Iterations Performed:** {iteration_count}
 
 **Top Results:**
-{results_summary}
-
-Provide a comprehensive analysis in JSON format with:
-
-{{
-    "executive_summary": "2-3 sentence overview of findings",
-    "key_patterns": [
-        "Notable pattern 1",
-        "Notable pattern 2"
-    ],
-    "top_recommendations": [
-        {{
-            "code": "just the code value (e.g., 'J44.9' or 'metFORMIN (Oral Pill)') - do NOT include the dataset name",
-            "system": "just the dataset name WITHOUT brackets (e.g., 'ICD10CM' or 'RXTERMS')",
-            "use_case": "when to use this code",
-            "confidence": "high|medium|low"
-        }}
-    ],
-    "clinical_context": "Important clinical considerations, warnings, or context",
-    "search_quality": "excellent|good|fair|poor",
-    "search_quality_explanation": "why this quality rating",
-    "next_steps": [
-        "Suggested action 1",
-        "Suggested action 2"
-    ]
-}}
-
-IMPORTANT: Include ALL codes with relevance score >= 0.7 in top_recommendations (there are {quality_metrics.get('high_quality_count', 0)} high-quality results).
-Be specific, accurate, and clinically useful."""
+{results_summary}"""
+        
+        # Static instructions first so the prompt shares a cacheable prefix
+        prompt = self.STATIC_INSTRUCTIONS + "\n\n---\n\n" + dynamic_tail
         
         return prompt
     
     def _format_results_for_prompt(self, results: List[Dict[str, Any]]) -> str:
         """Format results for LLM prompt"""
-        formatted = []
-        
-        for i, result in enumerate(results, 1):
-            code = result.get("code", "N/A")
-            desc = result.get("description", "No description")
-            dataset = result.get("dataset", "unknown")
-            relevance = result.get("relevance_score", 0)
-            
-            formatted.append(
-                f"{i}. [{dataset.upper()}] {code}: {desc}\n"
-                f"   Relevance: {relevance:.2f} ({result.get('relevance_level', 'unknown')})"
-            )
-        
-        return "\n\n".join(formatted) if formatted else "No results to display"
+        return "\n\n".join(
+            f"{i}. [{(result.get('dataset') or 'unknown').upper()}] "
+            f"{result.get('code', 'N/A')}: {result.get('description', 'No description')}\n"
+            f"   Relevance: {result.get('relevance_score', 0):.2f} "
+            f"({result.get('relevance_level', 'unknown')})"
+            for i, result in enumerate(results, 1)
+        ) or "No results to display"
     
     def _parse_synthesis_response(self, content: str) -> Dict[str, Any]:
         """Parse JSON synthesis from LLM response"""
         try:
-            # Extract JSON if wrapped in code blocks
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
+            # Structured output guarantees a bare JSON object with every
+            # required field, so no fence extraction or default patching
+            # Collapse double brackets the LLM sometimes writes in text fields
+            content = BRACKETED_PATTERN.sub(r"[\1]", content)
             
-            # Fix common LLM formatting errors before parsing
-            # Remove double brackets that LLM sometimes adds
-            content = content.replace("[[", "[").replace("]]", "]")
+            synthesis = orjson.loads(content)
             
-            synthesis = json.loads(content)
-            
-            # Validate required fields
-            required_fields = [
-                "executive_summary",
-                "key_patterns",
-                "clinical_context",
-                "search_quality"
-            ]
-            
-            for field in required_fields:
-                if field not in synthesis:
-                    synthesis[field] = self._get_default_field(field)
-            
-            # Fix double brackets in recommendations that might have survived JSON parsing
-            # LLM sometimes generates [[DATASET]] instead of [DATASET]
-            if "top_recommendations" in synthesis:
-                for rec in synthesis["top_recommendations"]:
-                    if "system" in rec:
-                        # Remove ALL brackets first, then re-wrap with single brackets
-                        system_name = rec["system"].replace("[", "").replace("]", "").strip()
-                        rec["system"] = system_name
+            # Strip brackets from system names ([ICD10CM] -> ICD10CM)
+            for rec in synthesis.get("top_recommendations", []):
+                if "system" in rec:
+                    rec["system"] = rec["system"].replace("[", "").replace("]", "").strip()
             
             return synthesis
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse synthesis JSON: {e}")
             logger.debug(f"Raw content: {content}")
             return self._create_simple_synthesis(content)
     
-    def _get_default_field(self, field: str) -> Any:
-        """Get default value for missing field"""
-        defaults = {
-            "executive_summary": "Analysis complete. Results retrieved from medical coding databases.",
-            "key_patterns": [],
-            "top_recommendations": [],
-            "clinical_context": "Review results with clinical context in mind.",
-            "search_quality": "unknown",
-            "search_quality_explanation": "Unable to assess quality",
-            "next_steps": ["Review results", "Consult with medical professional if needed"]
-        }
-        return defaults.get(field, "")
-    
     def _create_simple_synthesis(self, content: str) -> Dict[str, Any]:
         """Create simple synthesis from unparsed content"""
         return {
@@ -275,52 +463,27 @@ Be specific, accurate, and clinically useful."""
     ) -> List[Dict[str, Any]]:
         """Extract top results across all datasets, prioritizing primary coding systems"""
         
-        # Define priority order for coding systems (official codes first)
-        primary_systems = [
-            "icd10cm", "icd11", "icd9cm_dx", "icd9cm_sg",  # Diagnosis/procedure codes (highest priority)
-            "loinc",  # Lab tests
-            "rxterms", "drugs",  # Medications
-            "hcpcs",  # Procedures/services
-            "hpo",  # Phenotypes (important for genetics)
-            "clinvar", "genes", "snps",  # Genomics
-            "pharmvar",  # Pharmacogenomics
-            "npi_idv", "npi_org"  # Providers
-        ]
-        
-        # Separate results by priority, with score boost for primary systems
-        priority_results = []
-        secondary_results = []
-        
-        for dataset, data in scored_results.get("results", {}).items():
-            is_primary = dataset in primary_systems
-            
-            for item in data.get("results", []):
-                # Apply a score boost to primary systems to ensure they rank higher
-                # This ensures ICD codes appear in top recommendations even if
-                # secondary datasets (like 'conditions') have slightly higher raw scores
-                adjusted_item = item.copy()
-                if is_primary:
-                    # Boost primary system scores by 0.15 for ranking purposes only
-                    adjusted_item["ranking_score"] = item.get("relevance_score", 0) + 0.15
-                    priority_results.append(adjusted_item)
-                else:
-                    adjusted_item["ranking_score"] = item.get("relevance_score", 0)
-                    secondary_results.append(adjusted_item)
-        
-        # Sort each group by ranking score (boosted for primary systems)
-        priority_results.sort(
-            key=lambda x: x.get("ranking_score", 0),
-            reverse=True
-        )
-        secondary_results.sort(
-            key=lambda x: x.get("ranking_score", 0),
-            reverse=True
+        # Primary systems rank ahead of secondary ones, and their scores get a
+        # boost for ranking purposes only. This ensures ICD codes appear
+        # in top recommendations even if secondary datasets (like 'conditions')
+        # have slightly higher raw scores
+        candidates = (
+            (is_primary, item.get("relevance_score", 0) + boost, item)
+            for dataset, data in scored_results.get("results", {}).items()
+            for is_primary, boost in (
+                (True, PRIMARY_SYSTEM_BOOST) if dataset in PRIMARY_SYSTEMS else (False, 0),
+            )
+            for item in data.get("results", [])
         )
         
-        # Combine: prioritize primary systems, then add secondary if needed
-        all_results = priority_results + secondary_results
+        # Partial selection on (is_primary, ranking_score) with a C-level key;
+        # only the winners are copied
+        top = heapq.nlargest(limit, candidates, key=operator.itemgetter(0, 1))
         
-        return all_results[:limit]
+        return [
+            {**item, "ranking_score": ranking_score}
+            for _, ranking_score, item in top
+        ]
     
     def _fallback_synthesis(
         self,
@@ -385,8 +548,9 @@ Be specific, accurate, and clinically useful."""
             ]
         }
     
-    def format_synthesis_for_display(self, synthesis: Dict[str, Any]) -> str:
-        """Format synthesis for console display"""
+    @staticmethod
+    def format_synthesis_for_display(synthesis: Dict[str, Any]) -> str:
+        """Format synthesis for console display (no agent instance needed)"""
         output = []
         
         output.append("=" * 80)
@@ -3,33 +3,77 @@ Medical Terminology Resolution Agent
 Uses LLM to identify the type of medical term and map to appropriate coding systems
 """
 
+import asyncio
+import copy
+import hashlib
+import json
 import logging
-from typing import Dict, List, Any
-from langchain_openai import ChatOpenAI
+import re
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
+from cachetools import TTLCache
 from langchain_core.messages import SystemMessage, HumanMessage
+from agents.llm_pool import get_chat_model
 from config import config
 
+try:
+    import diskcache
+except ImportError:  # Persistent analysis cache is optional
+    diskcache = None
+
 logger = logging.getLogger(__name__)
 
+# Datasets searched when the LLM returns an unknown term type
+DEFAULT_DATASETS = ("icd10cm", "loinc", "rxterms")
+
+# Unambiguous terms classified without an LLM call, by term type
+FAST_PATH_TERMS = {
+    "lab_test": (
+        "glucose", "blood glucose", "hemoglobin", "hemoglobin a1c", "hba1c", "a1c",
+        "lipid panel", "complete blood count", "cbc",
+        "basic metabolic panel", "comprehensive metabolic panel"
+    ),
+    "medical_equipment": (
+        "wheelchair", "walker", "crutch", "crutches", "cpap", "cpap machine",
+        "nebulizer", "hospital bed", "oxygen concentrator", "prosthetic limb"
+    )
+}
+# One alternation with a named group per term type; the whole term must match
+FAST_PATH_PATTERN = re.compile(
+    "|".join(
+        f"(?P<{term_type}>{'|'.join(re.escape(term) for term in terms)})"
+        for term_type, terms in FAST_PATH_TERMS.items()
+    ),
+    re.IGNORECASE
+)
+
 
 class TerminologyAgent:
     """Agent for resolving medical terminology and identifying appropriate coding systems"""
     
-    # Mapping of term types to relevant datasets
-    TERM_TYPE_DATASETS = {
-        "diagnosis": ["icd10cm", "icd11", "icd9cm_dx", "conditions"],
-        "procedure": ["hcpcs", "icd9cm_sg", "procedures"],
-        "lab_test": ["loinc"],
-        "medication": ["rxterms", "drugs"],
-        "medical_equipment": ["hcpcs"],  # DME, prosthetics, wheelchairs, etc.
-        "unit": ["ucum"],
-        "phenotype": ["hpo", "icd10cm", "conditions"],  # Include ICD codes for phenotypes too
-        "genetic_variant": ["clinvar", "snps"],
-        "gene": ["genes"],
-        "genetic_disease": ["genetic_diseases", "hpo"],  # Include HPO for genetic diseases
-        "pharmacogenomics": ["pharmvar"],
-        "provider": ["npi_idv", "npi_org"]
-    }
+    __slots__ = ("llm", "cache", "disk", "_system_message", "_disk_prefix")
+    
+    # Repeated terms ("diabetes", "COPD", "metformin") skip the LLM call
+    ANALYSIS_CACHE_TTL = 3600  # 1 hour
+    ANALYSIS_CACHE_MAX_SIZE = 2048
+    # Analyses persisted on disk survive restarts
+    ANALYSIS_DISK_CACHE_TTL = 86400  # 24 hours
+    
+    # Immutable mapping of term types to relevant datasets
+    TERM_TYPE_DATASETS: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+        "diagnosis": ("icd10cm", "icd11", "icd9cm_dx", "conditions"),
+        "procedure": ("hcpcs", "icd9cm_sg", "procedures"),
+        "lab_test": ("loinc",),
+        "medication": ("rxterms", "drugs"),
+        "medical_equipment": ("hcpcs",),  # DME, prosthetics, wheelchairs, etc.
+        "unit": ("ucum",),
+        "phenotype": ("hpo", "icd10cm", "conditions"),  # Include ICD codes for phenotypes too
+        "genetic_variant": ("clinvar", "snps"),
+        "gene": ("genes",),
+        "genetic_disease": ("genetic_diseases", "hpo"),  # Include HPO for genetic diseases
+        "pharmacogenomics": ("pharmvar",),
+        "provider": ("npi_idv", "npi_org")
+    })
     
     SYSTEM_PROMPT = """You are a medical terminology expert. Your job is to analyze clinical terms and identify:
 1. The type of medical term (diagnosis, procedure, lab test, medication, unit, phenotype, genetic variant, gene, provider, etc.)
@@ -71,12 +115,26 @@ Respond in JSON format with:
 }"""
     
     def __init__(self, model_name: str = None, temperature: float = None):
-        self.llm = ChatOpenAI(
-            model=model_name or config.llm.TERMINOLOGY_MODEL,
-            temperature=temperature if temperature is not None else config.llm.TERMINOLOGY_TEMPERATURE
+        model_name = model_name or config.llm.TERMINOLOGY_MODEL
+        if temperature is None:
+            temperature = config.llm.TERMINOLOGY_TEMPERATURE
+        self.llm = get_chat_model(model_name, temperature)
+        # Built once; the system prompt is a class constant
+        self._system_message = SystemMessage(content=self.SYSTEM_PROMPT)
+        # Successful LLM analyses keyed on the normalized term
+        self.cache = TTLCache(
+            maxsize=self.ANALYSIS_CACHE_MAX_SIZE,
+            ttl=self.ANALYSIS_CACHE_TTL
         )
+        self.disk = None
+        if diskcache is not None and config.llm.TERMINOLOGY_DISK_CACHE_DIR:
+            self.disk = diskcache.Cache(config.llm.TERMINOLOGY_DISK_CACHE_DIR)
+        # Persisted analyses are only valid for the model, temperature and
+        # prompt that produced them; changing any of these starts a new keyspace
+        fingerprint = f"{model_name}\0{temperature}\0{self.SYSTEM_PROMPT}"
+        self._disk_prefix = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
     
-    def analyze_term(self, term: str) -> Dict[str, Any]:
+    async def analyze_term(self, term: str) -> Dict[str, Any]:
         """
         Analyze a medical term and determine its type and relevant datasets
         
@@ -86,45 +144,56 @@ Respond in JSON format with:
         Returns:
             Dictionary with term analysis
         """
+        cache_key = " ".join(term.lower().split())
+        
+        # Obvious terms skip the LLM entirely
+        match = FAST_PATH_PATTERN.fullmatch(cache_key)
+        if match:
+            term_type = match.lastgroup
+            logger.info(f"Term analysis fast path for '{term}': {term_type}")
+            return {
+                "term_type": term_type,
+                "confidence": 0.9,
+                "reasoning": "Exact match on a known unambiguous term",
+                "search_terms": [term.strip()],
+                "primary_datasets": self.TERM_TYPE_DATASETS[term_type],
+                "secondary_datasets": []
+            }
+        
+        if cache_key in self.cache:
+            logger.info(f"Term analysis cache hit for '{term}'")
+            # Deep copy so callers cannot mutate the cached analysis
+            return copy.deepcopy(self.cache[cache_key])
+        
+        cached = self._disk_get(cache_key)
+        if cached is not None:
+            logger.info(f"Term analysis disk cache hit for '{term}'")
+            self.cache[cache_key] = cached
+            return copy.deepcopy(cached)
+        
         try:
             messages = [
-                SystemMessage(content=self.SYSTEM_PROMPT),
+                self._system_message,
                 HumanMessage(content=f"Analyze this medical term: '{term}'")
             ]
             
-            response = self.llm.invoke(messages)
+            response = await self.llm.ainvoke(messages)
             
             # Parse JSON response
-            import json
             try:
                 # Extract JSON from response
                 content = response.content
                 if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
+                    content = content.partition("```json")[2].partition("```")[0].strip()
                 elif "```" in content:
-                    content = content.split("```")[1].split("```")[0].strip()
+                    content = content.partition("```")[2].partition("```")[0].strip()
                     
-                result = json.loads(content)
-                
-                # Validate and enhance result
-                if "term_type" not in result:
-                    result["term_type"] = "diagnosis"  # Default fallback
-                
-                # Always use our predefined dataset mappings based on term_type
-                # Override whatever the LLM suggested to ensure correct dataset names
-                result["primary_datasets"] = self.TERM_TYPE_DATASETS.get(
-                    result["term_type"], 
-                    ["icd10cm", "loinc", "rxterms"]
-                )
-                
-                if "search_terms" not in result:
-                    result["search_terms"] = [term]
+                result = self._finalize_analysis(term, json.loads(content))
                 
-                logger.info(f"Term analysis for '{term}': {result['term_type']} (confidence: {result.get('confidence', 0)})")
-                logger.info(f"Primary datasets: {result.get('primary_datasets')}")
-                logger.info(f"Search terms: {result.get('search_terms')}")
-                
-                return result
+                # Fallback analyses are not cached so the LLM is retried
+                self.cache[cache_key] = result
+                self._disk_set(cache_key, result)
+                return copy.deepcopy(result)
                 
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse LLM response as JSON: {e}")
@@ -135,6 +204,138 @@ Respond in JSON format with:
             logger.error(f"Error analyzing term '{term}': {e}")
             return self._fallback_analysis(term)
     
+    async def analyze_batch(self, terms: List[str], batch_size: int = 8) -> List[Dict[str, Any]]:
+        """
+        Analyze several terms, asking the LLM about up to batch_size at once
+        
+        Fast-path and cached terms are answered without the LLM. A batch
+        whose response cannot be parsed falls back to per-term analysis.
+        
+        Args:
+            terms: Clinical terms to analyze
+            batch_size: Maximum terms per LLM call
+            
+        Returns:
+            Term analyses in the same order as terms
+        """
+        cache_keys = [" ".join(term.lower().split()) for term in terms]
+        analyses: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, str] = {}
+        for term, cache_key in zip(terms, cache_keys):
+            if cache_key in analyses or cache_key in pending:
+                continue
+            if FAST_PATH_PATTERN.fullmatch(cache_key) or cache_key in self.cache:
+                analyses[cache_key] = await self.analyze_term(term)
+                continue
+            cached = self._disk_get(cache_key)
+            if cached is not None:
+                self.cache[cache_key] = cached
+                analyses[cache_key] = cached
+            else:
+                pending[cache_key] = term
+        
+        batches = [
+            list(pending.items())[i:i + batch_size]
+            for i in range(0, len(pending), batch_size)
+        ]
+        semaphore = asyncio.Semaphore(config.llm.MAX_CONCURRENCY or 8)
+        
+        async def analyze_one_batch(batch: List[Tuple[str, str]]):
+            async with semaphore:
+                analyses.update(await self._analyze_llm_batch(batch))
+        
+        await asyncio.gather(*[analyze_one_batch(batch) for batch in batches])
+        
+        return [copy.deepcopy(analyses[cache_key]) for cache_key in cache_keys]
+    
+    async def _analyze_llm_batch(self, batch: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """Analyze (cache key, term) pairs with a single LLM call"""
+        if len(batch) == 1:
+            cache_key, term = batch[0]
+            return {cache_key: await self.analyze_term(term)}
+        
+        batch_terms = [term for _, term in batch]
+        try:
+            messages = [
+                self._system_message,
+                HumanMessage(content=(
+                    "Analyze each of these medical terms. Respond with a JSON array "
+                    "holding one analysis object per term, in the same order: "
+                    f"{json.dumps(batch_terms)}"
+                ))
+            ]
+            response = await self.llm.ainvoke(messages)
+            
+            content = response.content
+            if "```json" in content:
+                content = content.partition("```json")[2].partition("```")[0].strip()
+            elif "```" in content:
+                content = content.partition("```")[2].partition("```")[0].strip()
+            
+            results = json.loads(content)
+            if (not isinstance(results, list) or len(results) != len(batch)
+                    or not all(isinstance(result, dict) for result in results)):
+                raise ValueError(f"expected {len(batch)} analyses")
+        except Exception as e:
+            logger.warning(f"Batch term analysis failed, analyzing individually: {e}")
+            analyses = await asyncio.gather(*[self.analyze_term(term) for term in batch_terms])
+            return {cache_key: analysis for (cache_key, _), analysis in zip(batch, analyses)}
+        
+        analyses = {}
+        for (cache_key, term), result in zip(batch, results):
+            result = self._finalize_analysis(term, result)
+            self.cache[cache_key] = result
+            self._disk_set(cache_key, result)
+            analyses[cache_key] = result
+        return analyses
+    
+    def _finalize_analysis(self, term: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate a parsed LLM analysis and fill in derived fields"""
+        # Validate and enhance result
+        if "term_type" not in result:
+            result["term_type"] = "diagnosis"  # Default fallback
+        
+        # Always use our predefined dataset mappings based on term_type
+        # Override whatever the LLM suggested to ensure correct dataset names
+        result["primary_datasets"] = self.TERM_TYPE_DATASETS.get(
+            result["term_type"], DEFAULT_DATASETS
+        )
+        
+        if "search_terms" not in result:
+            result["search_terms"] = [term]
+        
+        logger.info(f"Term analysis for '{term}': {result['term_type']} (confidence: {result.get('confidence', 0)})")
+        logger.info(f"Primary datasets: {result.get('primary_datasets')}")
+        logger.info(f"Search terms: {result.get('search_terms')}")
+        return result
+    
+    def _disk_get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Look up a persisted analysis"""
+        if self.disk is None:
+            return None
+        try:
+            return self.disk.get(f"{self._disk_prefix}:{cache_key}")
+        except Exception as e:
+            logger.warning(f"Term analysis disk cache read failed: {e}")
+            return None
+    
+    def _disk_set(self, cache_key: str, result: Dict[str, Any]):
+        """Persist an analysis for later processes"""
+        if self.disk is None:
+            return
+        try:
+            self.disk.set(
+                f"{self._disk_prefix}:{cache_key}",
+                result,
+                expire=self.ANALYSIS_DISK_CACHE_TTL
+            )
+        except Exception as e:
+            logger.warning(f"Term analysis disk cache write failed: {e}")
+    
+    def analyze_term_sync(self, term: str) -> Dict[str, Any]:
+        """Synchronous wrapper for callers outside an event loop"""
+        return asyncio.run(self.analyze_term(term))
+    
     def _fallback_analysis(self, term: str) -> Dict[str, Any]:
         """Fallback analysis using keyword matching"""
         term_lower = term.lower()
@@ -158,6 +359,6 @@ Respond in JSON format with:
             "confidence": 0.5,
             "reasoning": "Fallback keyword-based detection",
             "search_terms": [term],
-            "primary_datasets": self.TERM_TYPE_DATASETS.get(term_type, ["icd10cm"]),
+            "primary_datasets": self.TERM_TYPE_DATASETS.get(term_type, ("icd10cm",)),
             "secondary_datasets": []
         }
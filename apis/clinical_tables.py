@@ -4,16 +4,255 @@ Handles all interactions with the Clinical Tables API endpoints
 """
 
 import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Optional, Any
+import os
+import random
+import threading
+import weakref
+from types import MappingProxyType
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Any, Tuple
 import aiohttp
-import requests
-from cachetools import TTLCache
+import orjson
+from yarl import URL
+from cachetools import LRUCache, TTLCache
 from datetime import datetime
 from config import config
 
+try:
+    import diskcache
+except ImportError:  # Disk cache tier is optional
+    diskcache = None
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 transport is optional
+    httpx = None
+
+try:
+    import xxhash
+except ImportError:  # Compact hashed cache keys are optional; tuples are used otherwise
+    xxhash = None
+
+try:
+    import msgspec
+except ImportError:  # Typed response decoding is optional; orjson is used otherwise
+    msgspec = None
+
 logger = logging.getLogger(__name__)
 
+# Process-wide sessions so every client reuses pooled keep-alive connections;
+# one per event loop so the sync background loop does not evict the main one
+_SESSIONS: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+# Optional HTTP/2 clients multiplexing every search over one connection
+_HTTP2_CLIENTS: Dict[asyncio.AbstractEventLoop, Any] = {}
+_HTTP2_UNAVAILABLE = False
+# Background loop that runs search_sync calls on the shared async path
+_BACKGROUND_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_BACKGROUND_LOCK = threading.Lock()
+# Live clients, so close_session() can stop their background tasks
+_CLIENTS: "weakref.WeakSet[ClinicalTablesClient]" = weakref.WeakSet()
+
+
+def _prune_closed_loops(clients: Dict[asyncio.AbstractEventLoop, Any]):
+    """Forget clients whose event loop has finished (e.g. an earlier asyncio.run)"""
+    for loop in [loop for loop in clients if loop.is_closed()]:
+        del clients[loop]
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """
+    Get the shared aiohttp session for the running loop, creating it on first use
+    
+    A new session is created if the previous one was closed or the running
+    loop has none yet (e.g. a later asyncio.run call).
+    
+    Returns:
+        Shared ClientSession for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    
+    if session is None or session.closed:
+        _prune_closed_loops(_SESSIONS)
+        # No explicit Accept-Encoding: aiohttp offers gzip/deflate, plus br
+        # when Brotli is installed, and only what it can decode
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=config.api.CONNECTION_LIMIT,
+                limit_per_host=config.api.CONNECTION_LIMIT_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=75
+            ),
+            timeout=aiohttp.ClientTimeout(total=config.api.REQUEST_TIMEOUT)
+        )
+        _SESSIONS[loop] = session
+    
+    return session
+
+
+def get_http2_client():
+    """
+    Get the shared HTTP/2 client when enabled, creating it on first use
+    
+    Returns:
+        Shared httpx.AsyncClient, or None if HTTP/2 is disabled or unavailable
+    """
+    global _HTTP2_UNAVAILABLE
+    if not config.api.USE_HTTP2 or httpx is None or _HTTP2_UNAVAILABLE:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _HTTP2_CLIENTS.get(loop)
+    
+    if client is None or client.is_closed:
+        try:
+            client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=config.api.CONNECTION_LIMIT_PER_HOST
+                ),
+                timeout=config.api.REQUEST_TIMEOUT
+            )
+        except ImportError as e:
+            # httpx without the h2 extra; stay on aiohttp
+            logger.warning(f"HTTP/2 unavailable, using aiohttp: {e}")
+            _HTTP2_UNAVAILABLE = True
+            return None
+        _prune_closed_loops(_HTTP2_CLIENTS)
+        _HTTP2_CLIENTS[loop] = client
+    
+    return client
+
+
+async def close_session():
+    """
+    Stop clients' background tasks and close the running loop's shared HTTP
+    clients (call on application shutdown)
+    """
+    for client in list(_CLIENTS):
+        await client.aclose()
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+    client = _HTTP2_CLIENTS.pop(loop, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """Start the daemon thread running the sync-call event loop on first use"""
+    global _BACKGROUND_LOOP
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND_LOOP is None:
+            _BACKGROUND_LOOP = asyncio.new_event_loop()
+            threading.Thread(
+                target=_BACKGROUND_LOOP.run_forever,
+                name="clinical-tables-sync",
+                daemon=True
+            ).start()
+    return _BACKGROUND_LOOP
+
+
+def load_prefetch_terms() -> List[str]:
+    """
+    Seed terms for cache warm-up: configured terms, then persisted recent lookups
+    
+    Returns:
+        Unique seed terms, at most PREFETCH_MAX_TERMS
+    """
+    terms = [t.strip() for t in config.api.PREFETCH_TERMS.split(",") if t.strip()]
+    path = config.api.PREFETCH_FILE
+    if path and os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                terms.extend(orjson.loads(f.read()))
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.warning(f"Could not read prefetch terms from {path}: {e}")
+    return list(dict.fromkeys(terms))[:config.api.PREFETCH_MAX_TERMS]
+
+
+def remember_prefetch_term(term: str):
+    """Persist a looked-up term so the next process start warms it"""
+    path = config.api.PREFETCH_FILE
+    if not path:
+        return
+    terms = []
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                terms = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            terms = []
+    # Most recent first, without duplicates
+    terms = list(dict.fromkeys([term, *terms]))[:config.api.PREFETCH_MAX_TERMS]
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(terms))
+    except OSError as e:
+        logger.warning(f"Could not save prefetch terms to {path}: {e}")
+
+
+# Datasets whose search can match on both code and name
+SEARCH_FIELD_DATASETS = frozenset({"icd10cm", "icd11", "icd9cm_dx", "icd9cm_sg"})
+
+
+def _build_endpoints(
+    base_url: str,
+    datasets: Mapping[str, str]
+) -> Mapping[str, URL]:
+    """Precompute each dataset's URL with its static query params encoded"""
+    return MappingProxyType({
+        name: URL(f"{base_url}/{endpoint}").with_query(
+            {"sf": "code,name"} if name in SEARCH_FIELD_DATASETS else {}
+        )
+        for name, endpoint in datasets.items()
+    })
+
+
+if msgspec is not None:
+    class SearchResponse(msgspec.Struct, array_like=True):
+        """Search response shape: [count, codes, extra, data, ...]"""
+        count: int = 0
+        codes: Optional[list] = None
+        extra: Any = None
+        data: Optional[list] = None
+    
+    _RESPONSE_DECODER = msgspec.json.Decoder(SearchResponse)
+
+
+def parse_search_response(body: bytes) -> Dict[str, Any]:
+    """
+    Decode a search response body into the client's result dict
+    
+    Args:
+        body: Raw JSON body of the form [count, [codes], null, [data]]
+        
+    Returns:
+        Dictionary with count, codes and data
+    """
+    if msgspec is not None:
+        try:
+            response = _RESPONSE_DECODER.decode(body)
+            return {
+                "count": response.count,
+                "codes": response.codes or [],
+                "data": response.data or []
+            }
+        except msgspec.ValidationError:
+            # Unexpected shape; fall through to the generic decoder
+            pass
+    
+    result = orjson.loads(body)
+    if len(result) >= 4:
+        return {
+            "count": result[0],
+            "codes": result[1] if result[1] else [],
+            "data": result[3] if result[3] else []
+        }
+    return {"count": 0, "codes": [], "data": []}
+
 
 class ClinicalTablesClient:
     """Client for interacting with Clinical Tables API"""
@@ -43,26 +282,176 @@ class ClinicalTablesClient:
         "pharmvar": "pharmvar_star_alleles/v3/search"
     }
     
+    # Dataset names that are aliases of another dataset's endpoint; they share
+    # its cache entries and in-flight requests
+    DATASET_ALIASES: Mapping[str, str] = MappingProxyType({"drugs": "rxterms"})
+    
+    # Datasets that change often (provider directories, variant databases);
+    # cached with CACHE_TTL_DYNAMIC_DATA instead of CACHE_TTL_STABLE_CODES
+    DYNAMIC_DATASETS = frozenset({"npi_idv", "npi_org", "clinvar", "pharmvar"})
+    
+    # Upper bound for a search_sync call, covering retries and backoff
+    SYNC_TIMEOUT = 30
+    
+    # Transient HTTP statuses worth retrying
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    
+    # Dataset -> URL with static params pre-encoded, built once
+    _ENDPOINTS = _build_endpoints(BASE_URL, DATASETS)
+    
     def __init__(self, rate_limit: int = None):
         self.rate_limit = rate_limit or config.api.RATE_LIMIT
-        self.session: Optional[aiohttp.ClientSession] = None
+        # Pending requests keyed like the cache, shared by concurrent callers
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # Caps in-flight requests from search_multiple; one per event loop,
+        # like the shared sessions, since a semaphore is bound to its loop
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        # Periodic expired-entry sweep; started on first search, stopped by
+        # aclose()
+        self._evict_task: Optional[asyncio.Task] = None
         # Cache with configurable TTL for stable medical codes
         self.cache = TTLCache(
             maxsize=config.api.CACHE_MAX_SIZE, 
             ttl=config.api.CACHE_TTL_STABLE_CODES
         )
+        # Shorter-lived cache for DYNAMIC_DATASETS, so their refreshes never
+        # evict or shorten stable entries
+        self.dynamic_cache = TTLCache(
+            maxsize=config.api.CACHE_MAX_SIZE,
+            ttl=config.api.CACHE_TTL_DYNAMIC_DATA
+        )
+        # Validators (ETag / Last-Modified) and last payload per query; these
+        # outlive TTL expiry so stale entries can be revalidated with a 304
+        self.validators: LRUCache = LRUCache(maxsize=config.api.CACHE_MAX_SIZE)
+        # Optional disk tier so stable codes survive restarts and are shared
+        # across processes
+        self.disk = None
+        if diskcache is not None and config.api.DISK_CACHE_DIR:
+            self.disk = diskcache.Cache(
+                config.api.DISK_CACHE_DIR,
+                size_limit=config.api.DISK_CACHE_SIZE_LIMIT
+            )
+            # Drop expired entries once at startup rather than per operation
+            self.disk.expire()
+        _CLIENTS.add(self)
         
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        await get_session()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # The shared session, the sweep and in-flight fetches (which warm-up
+        # and coalesced callers may still be waiting on) all outlive the
+        # context; close_session() stops them at shutdown
+        pass
+    
+    async def aclose(self):
+        """
+        Stop this client's background tasks (called by close_session())
+        
+        Cancels the eviction sweep, on whichever loop it runs, and the
+        in-flight fetches on the running loop, so none are left pending when
+        their loop closes or reopen a session after close_session(). The
+        sweep restarts on the next search.
+        """
+        loop = asyncio.get_running_loop()
+        pending = [task for task in self._inflight.values() if task.get_loop() is loop]
+        evict_task, self._evict_task = self._evict_task, None
+        if evict_task is not None and not evict_task.done():
+            evict_loop = evict_task.get_loop()
+            if evict_loop is loop:
+                pending.append(evict_task)
+            elif not evict_loop.is_closed():
+                # e.g. the search_sync background loop
+                evict_loop.call_soon_threadsafe(evict_task.cancel)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    def _get_cache_key(self, dataset: str, term: str, max_results: int) -> Hashable:
+        """
+        Generate cache key for a query
+        
+        With xxhash installed the key is a 128-bit int, far smaller than a
+        tuple holding the term string; 128 bits keeps collisions (which would
+        return another term's codes) out of reach. Otherwise a plain tuple.
+        """
+        dataset = self.DATASET_ALIASES.get(dataset, dataset)
+        if xxhash is None:
+            return (dataset, term, max_results)
+        return xxhash.xxh3_128_intdigest(f"{dataset}\0{term}\0{max_results}".encode())
+    
+    def _disk_key(self, cache_key: Hashable) -> str:
+        """Short, stable disk cache key for a query"""
+        return hashlib.sha1(repr(cache_key).encode()).hexdigest()
     
-    def _get_cache_key(self, dataset: str, term: str, max_results: int) -> str:
-        """Generate cache key for a query"""
-        return f"{dataset}:{term}:{max_results}"
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Request-limiting semaphore for the running loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            _prune_closed_loops(self._semaphores)
+            semaphore = asyncio.Semaphore(config.api.MAX_CONCURRENT_REQUESTS)
+            self._semaphores[loop] = semaphore
+        return semaphore
+    
+    def _ensure_evict_task(self):
+        """Start the background eviction sweep for the running loop"""
+        task = self._evict_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            self._evict_task = asyncio.create_task(self._evict_loop())
+    
+    async def _evict_loop(self):
+        """
+        Drop expired entries every CACHE_EVICT_INTERVAL seconds
+        
+        TTLCache otherwise expires lazily on writes, so a burst of writes pays
+        for every entry that expired since the last one, and idle caches hold
+        expired payloads indefinitely. Sweeping here keeps that work off the
+        search path; the disk tier is swept in a worker thread.
+        """
+        while True:
+            await asyncio.sleep(config.api.CACHE_EVICT_INTERVAL)
+            self.cache.expire()
+            self.dynamic_cache.expire()
+            if self.disk is not None:
+                try:
+                    await asyncio.to_thread(self.disk.expire)
+                except Exception as e:
+                    logger.warning(f"Disk cache eviction failed: {e}")
+    
+    def _memory_cache(self, dataset: str) -> Tuple[TTLCache, int]:
+        """In-memory cache and TTL for a dataset, by its volatility"""
+        if dataset in self.DYNAMIC_DATASETS:
+            return self.dynamic_cache, config.api.CACHE_TTL_DYNAMIC_DATA
+        return self.cache, config.api.CACHE_TTL_STABLE_CODES
+    
+    def _cache_get(self, dataset: str, cache_key: Hashable) -> Optional[Dict[str, Any]]:
+        """Look up a query in memory, then on disk"""
+        cache, _ = self._memory_cache(dataset)
+        cached = cache.get(cache_key)
+        if cached is None and self.disk is not None:
+            try:
+                cached = self.disk.get(self._disk_key(cache_key))
+            except Exception as e:
+                logger.warning(f"Disk cache read failed: {e}")
+            if cached is not None:
+                cache[cache_key] = cached
+        return cached
+    
+    def _cache_set(self, dataset: str, cache_key: Hashable, result: Dict[str, Any]):
+        """Store a query result in memory and on disk"""
+        cache, ttl = self._memory_cache(dataset)
+        cache[cache_key] = result
+        if self.disk is not None:
+            try:
+                self.disk.set(
+                    self._disk_key(cache_key),
+                    result,
+                    expire=ttl
+                )
+            except Exception as e:
+                logger.warning(f"Disk cache write failed: {e}")
     
     async def search(
         self, 
@@ -84,65 +473,153 @@ class ClinicalTablesClient:
             Dictionary with search results
         """
         cache_key = self._get_cache_key(dataset, term, max_results)
+        self._ensure_evict_task()
         
-        # Check cache first
-        if cache_key in self.cache:
-            logger.info(f"Cache hit for {dataset}: {term}")
-            return self.cache[cache_key]
+        # Check cache first (expired entries return None)
+        cached = self._cache_get(dataset, cache_key)
+        if cached is not None:
+            # Lazy %-formatting: this is the hottest line in the client
+            logger.info("Cache hit for %s: %s", dataset, term)
+            return cached
         
-        if dataset not in self.DATASETS:
+        endpoint = self._ENDPOINTS.get(dataset)
+        if endpoint is None:
             raise ValueError(f"Unknown dataset: {dataset}. Available: {list(self.DATASETS.keys())}")
         
-        endpoint = self.DATASETS[dataset]
-        url = f"{self.BASE_URL}/{endpoint}"
-        
+        # Only the per-call params are encoded; the static part is reused
         max_results = max_results or config.api.MAX_RESULTS_PER_DATASET
-        params = {
-            "terms": term,
-            "maxList": max_results
-        }
+        if df:
+            url = endpoint.update_query(terms=term, maxList=max_results, df=df)
+        else:
+            url = endpoint.update_query(terms=term, maxList=max_results)
         
-        # Add search fields for datasets that support them
-        if dataset in ["icd10cm", "icd11", "icd9cm_dx", "icd9cm_sg"]:
-            params["sf"] = "code,name"
+        # Coalesce concurrent identical queries onto one HTTP request
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None and inflight.get_loop() is loop:
+            logger.info("Joining in-flight request for %s: %s", dataset, term)
+            return await asyncio.shield(inflight)
         
-        if df:
-            params["df"] = df
+        # The fetch runs as its own task so a cancelled caller neither fails
+        # the other callers joined on it nor discards a response worth caching
+        task = loop.create_task(self._fetch(dataset, term, url, cache_key))
+        self._inflight[cache_key] = task
+        task.add_done_callback(lambda done: self._release_inflight(cache_key, done))
+        return await asyncio.shield(task)
+    
+    def _release_inflight(self, cache_key: Hashable, task: asyncio.Task):
+        """Forget a finished in-flight request"""
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+    
+    async def _fetch(
+        self,
+        dataset: str,
+        term: str,
+        url: URL,
+        cache_key: Hashable
+    ) -> Dict[str, Any]:
+        """Issue the HTTP request for a search and cache the parsed result"""
+        # Revalidate an expired entry instead of refetching it unconditionally
+        validator = self.validators.get(cache_key)
+        headers = {}
+        if validator is not None:
+            etag, last_modified, _ = validator
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
         
         try:
-            if not self.session:
-                # Fallback to synchronous request if no session
-                response = requests.get(url, params=params, timeout=10)
-                response.raise_for_status()
-                result = response.json()
+            status, body, response_headers = await self._request(url, headers)
+            if status == 304 and validator is not None:
+                # Unchanged upstream: refresh the TTL, keep the payload
+                self._cache_set(dataset, cache_key, validator[2])
+                logger.info("Cache revalidated for %s: %s", dataset, term)
+                return validator[2]
+            if len(body) > config.api.JSON_OFFLOAD_BYTES:
+                # Large payloads are decoded off the event loop so other
+                # searches in the fan-out keep progressing
+                parsed_result = await asyncio.to_thread(parse_search_response, body)
             else:
-                async with self.session.get(url, params=params, timeout=10) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-            
-            # Parse response format: [count, [codes], null, [data]]
-            if len(result) >= 4:
-                parsed_result = {
-                    "count": result[0],
-                    "codes": result[1] if result[1] else [],
-                    "data": result[3] if result[3] else []
-                }
-            else:
-                parsed_result = {"count": 0, "codes": [], "data": []}
+                parsed_result = parse_search_response(body)
+            etag = response_headers.get("ETag")
+            last_modified = response_headers.get("Last-Modified")
             
             # Cache the result
-            self.cache[cache_key] = parsed_result
-            logger.info(f"API call successful for {dataset}: {term} - Found {parsed_result['count']} results")
+            self._cache_set(dataset, cache_key, parsed_result)
+            if etag or last_modified:
+                self.validators[cache_key] = (etag, last_modified, parsed_result)
+            logger.info(
+                "API call successful for %s: %s - Found %s results",
+                dataset, term, parsed_result["count"]
+            )
             
             return parsed_result
             
         except aiohttp.ClientError as e:
-            logger.error(f"HTTP error searching {dataset} for '{term}': {e}")
+            logger.error("HTTP error searching %s for %r: %s", dataset, term, e)
             return {"count": 0, "codes": [], "data": [], "error": str(e)}
         except Exception as e:
-            logger.error(f"Error searching {dataset} for '{term}': {e}")
+            logger.error("Error searching %s for %r: %s", dataset, term, e)
             return {"count": 0, "codes": [], "data": [], "error": str(e)}
     
+    async def _request(
+        self,
+        url: URL,
+        headers: Dict[str, str]
+    ) -> Tuple[int, bytes, Mapping[str, str]]:
+        """
+        Send a GET, retrying transient failures with exponential backoff
+        
+        Only connection errors, timeouts and RETRY_STATUSES are retried, with
+        full jitter so concurrent retries do not arrive in lockstep.
+        
+        Returns:
+            Tuple of (status, body, response headers); error statuses other
+            than 304 raise
+        """
+        for attempt in range(config.api.MAX_RETRIES):
+            try:
+                return await self._send(url, headers)
+            except Exception as e:
+                if attempt == config.api.MAX_RETRIES - 1 or not self._is_retriable(e):
+                    raise
+                delay = random.uniform(0, config.api.RETRY_DELAY * (2 ** attempt))
+                logger.warning(f"Retrying {url} in {delay:.2f}s after: {e}")
+                await asyncio.sleep(delay)
+    
+    def _is_retriable(self, error: Exception) -> bool:
+        """Whether a request failure is transient"""
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.RETRY_STATUSES
+        if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+            return True
+        if httpx is not None:
+            if isinstance(error, httpx.HTTPStatusError):
+                return error.response.status_code in self.RETRY_STATUSES
+            return isinstance(error, httpx.TransportError)
+        return False
+    
+    async def _send(
+        self,
+        url: URL,
+        headers: Dict[str, str]
+    ) -> Tuple[int, bytes, Mapping[str, str]]:
+        """Send one GET over HTTP/2 when enabled, otherwise the aiohttp session"""
+        client = get_http2_client()
+        if client is not None:
+            response = await client.get(str(url), headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response.status_code, response.content, response.headers
+        
+        session = await get_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status != 304:
+                response.raise_for_status()
+            return response.status, await response.read(), response.headers
+    
     async def search_multiple(
         self, 
         term: str, 
@@ -160,58 +637,66 @@ class ClinicalTablesClient:
         Returns:
             Dictionary mapping dataset names to results
         """
-        if not self.session:
-            self.session = aiohttp.ClientSession()
-            
-        tasks = [
-            self.search(dataset, term, max_results)
-            for dataset in datasets
-        ]
+        semaphore = self._get_semaphore()
+        
+        async def bounded_search(dataset: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.search(dataset, term, max_results)
+        
+        # Aliases of the same endpoint are fetched once
+        unique = list(dict.fromkeys(self.DATASET_ALIASES.get(d, d) for d in datasets))
+        tasks = [bounded_search(dataset) for dataset in unique]
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
+        by_dataset = {
+            dataset: result if not isinstance(result, Exception) else {"count": 0, "codes": [], "data": [], "error": str(result)}
+            for dataset, result in zip(unique, results)
+        }
         
         return {
-            dataset: result if not isinstance(result, Exception) else {"count": 0, "codes": [], "data": [], "error": str(result)}
-            for dataset, result in zip(datasets, results)
+            dataset: by_dataset[self.DATASET_ALIASES.get(dataset, dataset)]
+            for dataset in datasets
         }
     
+    async def warm(
+        self,
+        seeds: Iterable[str],
+        datasets: List[str],
+        max_results: int = 10
+    ) -> int:
+        """
+        Prefetch results for seed terms so first lookups hit the cache
+        
+        Args:
+            seeds: Terms to prefetch
+            datasets: Datasets to search for each term
+            max_results: Maximum results per dataset (match the callers'
+                value so the cache keys line up)
+            
+        Returns:
+            Number of seed terms warmed
+        """
+        seeds = list(seeds)
+        await asyncio.gather(
+            *[self.search_multiple(term, datasets, max_results) for term in seeds]
+        )
+        logger.info(f"Warmed API cache for {len(seeds)} terms")
+        return len(seeds)
+    
     def search_sync(
         self, 
         dataset: str, 
         term: str, 
         max_results: int = 10
     ) -> Dict[str, Any]:
-        """Synchronous version of search for non-async contexts"""
-        cache_key = self._get_cache_key(dataset, term, max_results)
-        
-        if cache_key in self.cache:
-            logger.info(f"Cache hit for {dataset}: {term}")
-            return self.cache[cache_key]
-        
-        if dataset not in self.DATASETS:
-            raise ValueError(f"Unknown dataset: {dataset}")
-        
-        endpoint = self.DATASETS[dataset]
-        url = f"{self.BASE_URL}/{endpoint}"
-        
-        params = {"terms": term, "maxList": max_results}
-        if dataset in ["icd10cm", "icd11", "icd9cm_dx", "icd9cm_sg"]:
-            params["sf"] = "code,name"
+        """
+        Synchronous version of search for non-async contexts
         
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            
-            parsed_result = {
-                "count": result[0],
-                "codes": result[1] if len(result) > 1 and result[1] else [],
-                "data": result[3] if len(result) > 3 and result[3] else []
-            }
-            
-            self.cache[cache_key] = parsed_result
-            return parsed_result
-            
-        except Exception as e:
-            logger.error(f"Error in sync search: {e}")
-            return {"count": 0, "codes": [], "data": [], "error": str(e)}
+        Runs search on a shared background event loop, so sync callers get
+        the same pooled session, cache, coalescing and retries.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.search(dataset, term, max_results),
+            _get_background_loop()
+        )
+        return future.result(timeout=self.SYNC_TIMEOUT)
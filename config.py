@@ -4,7 +4,7 @@ All configurable parameters in one place
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -26,6 +26,17 @@ class AgenticConfig:
     # Early stopping
     ENABLE_EARLY_STOPPING = os.getenv("ENABLE_EARLY_STOPPING", "true").lower() == "true"
     EXCELLENT_QUALITY_THRESHOLD = float(os.getenv("EXCELLENT_QUALITY_THRESHOLD", "0.8"))
+    
+    # Stop waiting on secondary datasets once primary ones return enough matches
+    SKIP_SECONDARY_WHEN_SUFFICIENT = os.getenv("SKIP_SECONDARY_WHEN_SUFFICIENT", "true").lower() == "true"
+    
+    # Search the raw query on default datasets while the term is being analyzed
+    # (extra API load that only pays off when the analysis picks those
+    # datasets and the raw term, so opt-in)
+    SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+    
+    # Start refining while results are scored when retrieval returned no matches
+    SPECULATIVE_REFINEMENT = os.getenv("SPECULATIVE_REFINEMENT", "true").lower() == "true"
 
 
 class ScoringConfig:
@@ -60,6 +71,14 @@ class RefinementConfig:
     
     # Refinement after N iterations
     ALTERNATIVE_STRATEGY_AFTER_ITERATIONS = int(os.getenv("ALTERNATIVE_STRATEGY_AFTER_ITERATIONS", "2"))
+    
+    # Cache for LLM refinement suggestions
+    CACHE_TTL = int(os.getenv("REFINEMENT_CACHE_TTL", "3600"))  # 1 hour
+    CACHE_MAX_SIZE = int(os.getenv("REFINEMENT_CACHE_MAX_SIZE", "500"))
+    
+    # Relative distance from a threshold at which neighbouring strategies
+    # run speculatively in parallel (0 disables)
+    SPECULATION_WINDOW = float(os.getenv("REFINEMENT_SPECULATION_WINDOW", "0.2"))
 
 
 class LLMConfig:
@@ -77,8 +96,29 @@ class LLMConfig:
     SCORING_TEMPERATURE = float(os.getenv("SCORING_TEMPERATURE", "0.1"))
     SYNTHESIS_TEMPERATURE = float(os.getenv("SYNTHESIS_TEMPERATURE", "0.2"))
     
+    # OpenAI service tier for bulk LLM relevance scoring (e.g. "flex")
+    # Empty uses the provider default
+    SCORING_SERVICE_TIER = os.getenv("SCORING_SERVICE_TIER", "") or None
+    
     # Timeout settings (seconds)
     LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "30"))
+    
+    # Warm the synthesis prompt cache while retrieval runs (one billed
+    # request per PREWARM_INTERVAL while lookups run, so opt-in)
+    SYNTHESIS_PREWARM = os.getenv("SYNTHESIS_PREWARM", "false").lower() == "true"
+    
+    # Maximum concurrent LLM calls for batched requests
+    MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    
+    # Persistent term analysis cache (requires diskcache; empty dir disables)
+    TERMINOLOGY_DISK_CACHE_DIR = os.getenv("TERMINOLOGY_DISK_CACHE_DIR", ".cache/term_analysis")
+    
+    # Reuse cached results for near-identical queries (off by default: close
+    # clinical terms such as type 1 vs type 2 diabetes can embed similarly)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "256"))
 
 
 class APIConfig:
@@ -86,6 +126,16 @@ class APIConfig:
     
     BASE_URL = os.getenv("CLINICAL_TABLES_BASE_URL", "https://clinicaltables.nlm.nih.gov/api")
     RATE_LIMIT = int(os.getenv("CLINICAL_TABLES_RATE_LIMIT", "100"))
+    MAX_CONCURRENT_REQUESTS = int(os.getenv("CLINICAL_TABLES_MAX_CONCURRENT_REQUESTS", "10"))
+    
+    # Shared HTTP connection pool
+    CONNECTION_LIMIT = int(os.getenv("CLINICAL_TABLES_CONNECTION_LIMIT", "100"))
+    CONNECTION_LIMIT_PER_HOST = int(os.getenv("CLINICAL_TABLES_CONNECTION_LIMIT_PER_HOST", "32"))
+    REQUEST_TIMEOUT = float(os.getenv("CLINICAL_TABLES_REQUEST_TIMEOUT", "10"))
+    # Multiplex searches over one HTTP/2 connection (requires httpx[http2])
+    USE_HTTP2 = os.getenv("CLINICAL_TABLES_USE_HTTP2", "false").lower() == "true"
+    # Response bodies larger than this are decoded in a worker thread
+    JSON_OFFLOAD_BYTES = int(os.getenv("CLINICAL_TABLES_JSON_OFFLOAD_BYTES", "32768"))
     
     # Results per dataset
     MAX_RESULTS_PER_DATASET = int(os.getenv("MAX_RESULTS_PER_DATASET", "10"))
@@ -94,6 +144,17 @@ class APIConfig:
     CACHE_TTL_STABLE_CODES = int(os.getenv("CACHE_TTL_STABLE_CODES", "86400"))  # 24 hours
     CACHE_TTL_DYNAMIC_DATA = int(os.getenv("CACHE_TTL_DYNAMIC_DATA", "3600"))   # 1 hour
     CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+    CACHE_EVICT_INTERVAL = float(os.getenv("CACHE_EVICT_INTERVAL", "60"))  # Expired-entry sweep, seconds
+    
+    # Disk-backed second cache tier (requires diskcache; empty dir disables)
+    DISK_CACHE_DIR = os.getenv("CLINICAL_TABLES_DISK_CACHE_DIR", ".cache/clinical_tables")
+    DISK_CACHE_SIZE_LIMIT = int(os.getenv("CLINICAL_TABLES_DISK_CACHE_SIZE_LIMIT", str(1 << 30)))  # 1 GB
+    
+    # Cache warm-up at startup (comma-separated terms plus persisted recent lookups)
+    PREFETCH_TERMS = os.getenv("CLINICAL_TABLES_PREFETCH_TERMS", "")
+    PREFETCH_FILE = os.getenv("CLINICAL_TABLES_PREFETCH_FILE", ".cache/prefetch_terms.json")
+    PREFETCH_MAX_TERMS = int(os.getenv("CLINICAL_TABLES_PREFETCH_MAX_TERMS", "50"))
+    PREFETCH_DATASETS = os.getenv("CLINICAL_TABLES_PREFETCH_DATASETS", "icd10cm,loinc,rxterms")
     
     # Retry settings
     MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
@@ -115,6 +176,10 @@ class DisplayConfig:
     
     # Verbosity
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG, INFO, WARNING, ERROR
+    
+    # Full query results persisted across CLI runs (empty disables; needs diskcache)
+    QUERY_CACHE_DISK_DIR = os.getenv("QUERY_CACHE_DISK_DIR", ".cache/query_results")
+    QUERY_CACHE_DISK_TTL = int(os.getenv("QUERY_CACHE_DISK_TTL", "86400"))  # 24 hours
 
 
 class Config:
@@ -127,9 +192,26 @@ class Config:
     api = APIConfig()
     display = DisplayConfig()
     
+    # Settings are read once at import, so derived views are computed once
+    _validation: Optional[Dict[str, Any]] = None
+    _dict: Optional[Dict[str, Any]] = None
+    
+    @classmethod
+    def cache_clear(cls):
+        """Recompute validate()/to_dict() after settings are changed in place"""
+        cls._validation = None
+        cls._dict = None
+    
     @classmethod
     def validate(cls) -> Dict[str, Any]:
-        """Validate configuration and return any issues"""
+        """Validate configuration and return any issues (computed once)"""
+        if cls._validation is None:
+            cls._validation = cls._validate()
+        return cls._validation
+    
+    @classmethod
+    def _validate(cls) -> Dict[str, Any]:
+        """Run the configuration checks"""
         issues = []
         
         # Check scoring weights sum to 1.0
@@ -171,7 +253,14 @@ class Config:
     
     @classmethod
     def to_dict(cls) -> Dict[str, Any]:
-        """Export configuration as dictionary"""
+        """Export configuration as dictionary (shared; do not mutate)"""
+        if cls._dict is None:
+            cls._dict = cls._build_dict()
+        return cls._dict
+    
+    @classmethod
+    def _build_dict(cls) -> Dict[str, Any]:
+        """Build the exported configuration dictionary"""
         return {
             "agentic": {
                 "max_iterations": cls.agentic.MAX_ITERATIONS,
@@ -3,10 +3,19 @@ Clinical Term Lookup Workflow
 LangGraph workflow for intelligent medical term code lookup with iterative refinement
 """
 
+import asyncio
 import logging
-from typing import Dict, List, Any, TypedDict, Optional
+import operator
+from collections import defaultdict
+from types import MappingProxyType
+from typing import (
+    Annotated, Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal,
+    Mapping, Optional, Tuple, TypedDict
+)
+from langgraph.config import get_config
 from langgraph.graph import StateGraph, END
-from agents.terminology_agent import TerminologyAgent
+from langgraph.types import Command
+from agents.terminology_agent import DEFAULT_DATASETS, TerminologyAgent
 from agents.retrieval_agent import RetrievalAgent
 from agents.refinement_agent import SearchRefinementAgent
 from agents.scoring_agent import ResultScoringAgent
@@ -15,9 +24,37 @@ from config import config
 
 logger = logging.getLogger(__name__)
 
+# Display names for each dataset's coding system
+CODING_SYSTEM_NAMES: Mapping[str, str] = MappingProxyType({
+    "icd10cm": "ICD-10-CM",
+    "icd11": "ICD-11",
+    "icd9cm_dx": "ICD-9-CM Diagnoses",
+    "icd9cm_sg": "ICD-9-CM Procedures",
+    "loinc": "LOINC",
+    "rxterms": "RxTerms",
+    "drugs": "Drugs",
+    "hcpcs": "HCPCS",
+    "ucum": "UCUM",
+    "hpo": "HPO",
+    "conditions": "Medical Conditions",
+    "procedures": "Procedures",
+    "clinvar": "ClinVar",
+    "genes": "Genes",
+    "snps": "SNPs",
+    "genetic_diseases": "Genetic Diseases",
+    "pharmvar": "PharmVar",
+    "npi_idv": "NPI (Individuals)",
+    "npi_org": "NPI (Organizations)"
+})
+
 
 class ClinicalQueryState(TypedDict):
-    """State for the clinical term lookup workflow"""
+    """
+    State for the clinical term lookup workflow
+    
+    Nodes return only the keys they change; the history lists are
+    append-only and merged by LangGraph with operator.add.
+    """
     query: str
     term_analysis: Optional[Dict[str, Any]]
     retrieval_results: Optional[Dict[str, Any]]
@@ -27,10 +64,10 @@ class ClinicalQueryState(TypedDict):
     error: Optional[str]
     # Agentic iteration fields
     iteration_count: int
-    search_history: List[str]
+    search_history: Annotated[List[str], operator.add]
     result_quality: float
     refinement_strategy: Optional[str]
-    iteration_history: List[Dict[str, Any]]
+    iteration_history: Annotated[List[Dict[str, Any]], operator.add]
 
 
 class ClinicalWorkflow:
@@ -65,27 +102,17 @@ class ClinicalWorkflow:
         # Add nodes
         workflow.add_node("analyze_term", self._analyze_term)
         workflow.add_node("retrieve_codes", self._retrieve_codes)
-        workflow.add_node("score_results", self._score_results)
-        workflow.add_node("evaluate_quality", self._evaluate_quality)
+        workflow.add_node("score_and_route", self._score_and_route)
         workflow.add_node("refine_search", self._refine_search)
         workflow.add_node("synthesize_response", self._synthesize_response)
         
         # Build iterative flow
         workflow.set_entry_point("analyze_term")
         workflow.add_edge("analyze_term", "retrieve_codes")
-        workflow.add_edge("retrieve_codes", "score_results")
-        workflow.add_edge("score_results", "evaluate_quality")
-        
-        # Conditional routing based on quality evaluation
-        workflow.add_conditional_edges(
-            "evaluate_quality",
-            self._decide_next_action,
-            {
-                "refine": "refine_search",      # Need to improve results
-                "sufficient": "synthesize_response",  # Results are good enough
-                "complete": "synthesize_response"     # Max iterations reached
-            }
-        )
+        workflow.add_edge("retrieve_codes", "score_and_route")
+        
+        # score_and_route picks refine_search, retrieve_codes (refinement
+        # already done) or synthesize_response itself
         
         # Refinement loop back to retrieval
         workflow.add_edge("refine_search", "retrieve_codes")
@@ -93,47 +120,88 @@ class ClinicalWorkflow:
         
         return workflow.compile()
     
-    async def _analyze_term(self, state: ClinicalQueryState) -> ClinicalQueryState:
+    async def _analyze_term(self, state: ClinicalQueryState) -> Dict[str, Any]:
         """Analyze the medical term"""
         logger.info(f"Analyzing term: {state['query']}")
         
+        if state.get("term_analysis"):
+            # Analyzed up front by run_many
+            if config.llm.SYNTHESIS_PREWARM:
+                self.synthesis_agent.prepare_speculative(state["query"])
+            return {"term_analysis": self._normalize_analysis(state["term_analysis"])}
+        
         try:
-            analysis = self.terminology_agent.analyze_term(state["query"])
-            state["term_analysis"] = analysis
+            if config.agentic.SPECULATIVE_RETRIEVAL:
+                # Overlap the LLM analysis with a search for the raw query on
+                # the default datasets; retrieval then hits the warmed caches
+                analysis, _ = await asyncio.gather(
+                    self.terminology_agent.analyze_term(state["query"]),
+                    self._speculative_retrieve(state["query"])
+                )
+            else:
+                analysis = await self.terminology_agent.analyze_term(state["query"])
             logger.info(f"Term identified as: {analysis.get('term_type')}")
+            
+            # Synthesis only depends on results for its suffix; warm its
+            # cached prefix while retrieval and scoring run
+            if config.llm.SYNTHESIS_PREWARM:
+                self.synthesis_agent.prepare_speculative(state["query"])
+            return {"term_analysis": self._normalize_analysis(analysis)}
         except Exception as e:
             logger.error(f"Error in term analysis: {e}")
-            state["error"] = str(e)
-        
-        return state
+            return {"error": str(e)}
+    
+    def _normalize_analysis(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the lowercased dataset and search term sets every retrieval reads"""
+        primary_datasets = frozenset(d.lower() for d in analysis.get("primary_datasets", ["icd10cm"]))
+        return {
+            **analysis,
+            "_primary_datasets_lc": primary_datasets,
+            "_datasets_lc": primary_datasets.union(
+                d.lower() for d in analysis.get("secondary_datasets", [])
+            ),
+            "_search_terms_lc": frozenset(
+                t.lower() for t in analysis.get("search_terms", [])
+            )
+        }
     
-    async def _retrieve_codes(self, state: ClinicalQueryState) -> ClinicalQueryState:
+    async def _speculative_retrieve(self, query: str):
+        """Prefetch the raw query on the default datasets; failures are ignored"""
+        try:
+            await self.retrieval_agent.retrieve(
+                term=query,
+                datasets=list(DEFAULT_DATASETS),
+                max_results_per_dataset=config.display.MAX_CODES_PER_SYSTEM
+            )
+        except Exception as e:
+            logger.warning(f"Speculative retrieval failed: {e}")
+    
+    async def _retrieve_codes(self, state: ClinicalQueryState) -> Dict[str, Any]:
         """Retrieve medical codes from appropriate datasets"""
         iteration = state.get("iteration_count", 0)
         logger.info(f"Retrieving codes (iteration {iteration + 1})")
         
         if state.get("error"):
-            return state
+            return {}
         
         try:
             analysis = state.get("term_analysis", {})
-            primary_datasets = analysis.get("primary_datasets", ["icd10cm"])
-            secondary_datasets = analysis.get("secondary_datasets", [])
+            if "_datasets_lc" not in analysis:
+                analysis = self._normalize_analysis(analysis)
             
             # Use refined search terms if available, otherwise use original analysis
             refinement = state.get("refinement_strategy")
-            if refinement and iteration > 0:
-                search_terms = analysis.get("refined_search_terms", analysis.get("search_terms", [state["query"]]))
+            if refinement and "refined_search_terms" in analysis and iteration > 0:
+                search_terms = analysis["refined_search_terms"]
+                search_terms_lc = {t.lower() for t in search_terms}
                 logger.info(f"Using refined search terms: {search_terms[:3]}")
             else:
                 search_terms = analysis.get("search_terms", [state["query"]])
+                search_terms_lc = analysis["_search_terms_lc"]
             
-            # Normalize dataset names to lowercase
-            primary_datasets = [d.lower() for d in primary_datasets]
-            secondary_datasets = [d.lower() for d in secondary_datasets]
-            
-            # Sequential retrieval with early stopping
-            all_datasets = list(set(primary_datasets + secondary_datasets))
+            # Dataset names were lowercased once when the term was analyzed
+            primary_datasets = list(analysis["_primary_datasets_lc"])
+            all_datasets = list(analysis["_datasets_lc"])
             
             # Use the first generated search term (most formal) as primary, then alternatives
             # This ensures we search with the best term (e.g., "chronic obstructive pulmonary disease")
@@ -142,37 +210,88 @@ class ClinicalWorkflow:
             alternative_search_terms = search_terms[1:] if len(search_terms) > 1 else []
             
             # Also include original query if it's different from generated terms
-            if state["query"].lower() not in [t.lower() for t in search_terms]:
+            if state["query"].lower() not in search_terms_lc:
                 alternative_search_terms.append(state["query"])
             
+            # Secondary datasets are only waited for when the primary ones
+            # come back with too few matches
             results = await self.retrieval_agent.retrieve_with_alternatives(
                 term=primary_search_term,
                 alternative_terms=alternative_search_terms,
                 datasets=all_datasets,
-                max_results=config.display.MAX_CODES_PER_SYSTEM
+                max_results=config.display.MAX_CODES_PER_SYSTEM,
+                required_datasets=primary_datasets,
+                min_results=self.MIN_RESULTS_THRESHOLD if config.agentic.SKIP_SECONDARY_WHEN_SUFFICIENT else 0
             )
             
-            state["retrieval_results"] = results
-            
-            # Track search history
-            if "search_history" not in state:
-                state["search_history"] = []
-            state["search_history"].extend(search_terms)
-            
             logger.info(f"Retrieved {results.get('total_matches', 0)} matches")
             
+            # search_history is appended to by its reducer
+            return {
+                "retrieval_results": results,
+                "search_history": list(search_terms)
+            }
+            
         except Exception as e:
             logger.error(f"Error in code retrieval: {e}")
-            state["error"] = str(e)
+            return {"error": str(e)}
+    
+    async def _score_and_route(
+        self,
+        state: ClinicalQueryState
+    ) -> Command[Literal["refine_search", "retrieve_codes", "synthesize_response"]]:
+        """
+        Score results, evaluate quality and route in a single graph step
         
-        return state
+        One node instead of three saves two state hand-offs per iteration.
+        When retrieval returned no matches, refinement is started
+        alongside scoring and the next retrieval follows directly.
+        """
+        refinement = self._start_speculative_refinement(state)
+        try:
+            update = await self._score_results(state)
+            update.update(await self._evaluate_quality({**state, **update}))
+            
+            action = self._decide_next_action(update)
+            if action == "refine" and refinement is not None:
+                update.update(await refinement)
+                return Command(update=update, goto="retrieve_codes")
+        finally:
+            if refinement is not None and not refinement.done():
+                refinement.cancel()
+        
+        goto = "refine_search" if action == "refine" else "synthesize_response"
+        return Command(update=update, goto=goto)
     
-    async def _score_results(self, state: ClinicalQueryState) -> ClinicalQueryState:
+    def _start_speculative_refinement(self, state: ClinicalQueryState) -> Optional[asyncio.Task]:
+        """
+        Start refinement early when retrieval found nothing
+        
+        Zero matches is the only case where _evaluate_quality always refines
+        (below MAX_ITERATIONS) whatever the scores, so the refinement LLM
+        call is never started only to be thrown away.
+        """
+        retrieval_results = state.get("retrieval_results")
+        iteration = state.get("iteration_count", 0)
+        if (not config.agentic.SPECULATIVE_REFINEMENT or state.get("error")
+                or not retrieval_results or iteration >= self.MAX_ITERATIONS
+                or retrieval_results.get("total_matches", 0) != 0):
+            return None
+        
+        # Zero-match strategies only need the match counts, which scoring
+        # does not change, so the unscored results stand in for them
+        return asyncio.create_task(self._refine_search({
+            **state,
+            "scored_results": retrieval_results,
+            "iteration_count": iteration + 1
+        }))
+    
+    async def _score_results(self, state: ClinicalQueryState) -> Dict[str, Any]:
         """Score results for relevance"""
         logger.info("Scoring results for relevance")
         
         if state.get("error") or not state.get("retrieval_results"):
-            return state
+            return {}
         
         try:
             scored_results = await self.scoring_agent.score_results(
@@ -181,22 +300,19 @@ class ClinicalWorkflow:
                 term_analysis=state.get("term_analysis", {})
             )
             
-            state["scored_results"] = scored_results
-            
             quality_metrics = scored_results.get("quality_metrics", {})
             logger.info(f"Scoring complete. Avg relevance: {quality_metrics.get('avg_relevance', 0):.2f}")
+            return {"scored_results": scored_results}
             
         except Exception as e:
             logger.error(f"Error in result scoring: {e}")
             # Fall back to unscored results
-            state["scored_results"] = state["retrieval_results"]
-        
-        return state
+            return {"scored_results": state["retrieval_results"]}
     
-    async def _evaluate_quality(self, state: ClinicalQueryState) -> ClinicalQueryState:
+    async def _evaluate_quality(self, state: ClinicalQueryState) -> Dict[str, Any]:
         """Evaluate result quality and decide if refinement is needed"""
         iteration = state.get("iteration_count", 0)
-        scored_results = state.get("scored_results", {})
+        scored_results = state.get("scored_results") or {}
         
         # Calculate quality metrics
         total_matches = scored_results.get("total_matches", 0)
@@ -213,20 +329,18 @@ class ClinicalWorkflow:
             count_component = min(1.0, total_matches / 10.0) * config.agentic.QUALITY_COUNT_WEIGHT
             quality_score = relevance_component + count_component
         
-        state["result_quality"] = quality_score
-        state["iteration_count"] = iteration + 1
-        
-        # Record iteration history
-        if "iteration_history" not in state:
-            state["iteration_history"] = []
-        
-        state["iteration_history"].append({
-            "iteration": iteration + 1,
-            "total_matches": total_matches,
-            "avg_relevance": avg_relevance,
-            "quality_score": quality_score,
-            "high_quality_count": high_quality_count
-        })
+        update = {
+            "result_quality": quality_score,
+            "iteration_count": iteration + 1,
+            # Appended to iteration_history by its reducer
+            "iteration_history": [{
+                "iteration": iteration + 1,
+                "total_matches": total_matches,
+                "avg_relevance": avg_relevance,
+                "quality_score": quality_score,
+                "high_quality_count": high_quality_count
+            }]
+        }
         
         logger.info(
             f"Quality evaluation (iteration {iteration + 1}): "
@@ -236,31 +350,31 @@ class ClinicalWorkflow:
         
         # Decision logic
         if iteration >= self.MAX_ITERATIONS:
-            state["refinement_strategy"] = "complete"
+            update["refinement_strategy"] = "complete"
             logger.info("Max iterations reached, proceeding to synthesis")
         elif (self.ENABLE_EARLY_STOPPING and 
               quality_score >= self.EXCELLENT_QUALITY_THRESHOLD and 
               total_matches >= self.MIN_RESULTS_THRESHOLD):
-            state["refinement_strategy"] = "sufficient"
+            update["refinement_strategy"] = "sufficient"
             logger.info(f"Excellent quality ({quality_score:.2f}) achieved, early stopping")
         elif quality_score >= self.MIN_QUALITY_THRESHOLD and total_matches >= self.MIN_RESULTS_THRESHOLD:
-            state["refinement_strategy"] = "sufficient"
+            update["refinement_strategy"] = "sufficient"
             logger.info("Quality threshold met, proceeding to synthesis")
         elif total_matches == 0 or quality_score < 0.3:
-            state["refinement_strategy"] = "refine"
+            update["refinement_strategy"] = "refine"
             logger.info("Quality insufficient, will refine search")
         else:
-            state["refinement_strategy"] = "sufficient"
+            update["refinement_strategy"] = "sufficient"
             logger.info("Acceptable quality, proceeding to synthesis")
         
-        return state
+        return update
     
-    async def _refine_search(self, state: ClinicalQueryState) -> ClinicalQueryState:
+    async def _refine_search(self, state: ClinicalQueryState) -> Dict[str, Any]:
         """Refine search strategy based on previous results"""
         logger.info("Refining search strategy")
         
         if state.get("error"):
-            return state
+            return {}
         
         try:
             refinement = await self.refinement_agent.refine_strategy(
@@ -271,26 +385,27 @@ class ClinicalWorkflow:
                 search_history=state.get("search_history", [])
             )
             
-            # Update term analysis with refined search terms
-            term_analysis = state.get("term_analysis", {})
-            term_analysis["refined_search_terms"] = refinement.get("new_search_terms", [])
-            term_analysis["refinement_reasoning"] = refinement.get("reasoning", "")
-            state["term_analysis"] = term_analysis
-            
             logger.info(
                 f"Refinement strategy: {refinement.get('strategy', 'unknown')}, "
                 f"new terms: {refinement.get('new_search_terms', [])[:3]}"
             )
             
+            # Update term analysis with refined search terms
+            return {
+                "term_analysis": {
+                    **(state.get("term_analysis") or {}),
+                    "refined_search_terms": refinement.get("new_search_terms", []),
+                    "refinement_reasoning": refinement.get("reasoning", "")
+                }
+            }
+            
         except Exception as e:
             logger.error(f"Error in search refinement: {e}")
             # Mark as complete to avoid infinite loop
-            state["refinement_strategy"] = "complete"
-        
-        return state
+            return {"refinement_strategy": "complete"}
     
     def _decide_next_action(self, state: ClinicalQueryState) -> str:
-        """Conditional edge router based on refinement strategy"""
+        """Route based on refinement strategy (refine, sufficient or complete)"""
         strategy = state.get("refinement_strategy", "sufficient")
         
         if strategy == "refine":
@@ -300,33 +415,35 @@ class ClinicalWorkflow:
         else:
             return "sufficient"
     
-    async def _synthesize_response(self, state: ClinicalQueryState) -> ClinicalQueryState:
+    async def _synthesize_response(self, state: ClinicalQueryState) -> Dict[str, Any]:
         """Synthesize final response with intelligent insights"""
         logger.info("Synthesizing final response with insights")
         
         if state.get("error"):
-            state["final_response"] = {
-                "success": False,
-                "error": state["error"],
-                "query": state["query"]
+            return {
+                "final_response": {
+                    "success": False,
+                    "error": state["error"],
+                    "query": state["query"]
+                }
             }
-            return state
         
         try:
             analysis = state.get("term_analysis", {})
             scored_results = state.get("scored_results", state.get("retrieval_results", {}))
             iteration_history = state.get("iteration_history", [])
             
-            # Generate intelligent synthesis
+            # Generate intelligent synthesis, forwarding partial output to
+            # the caller's stream callback (see run) as it is generated
+            stream_callback = get_config().get("configurable", {}).get("stream_callback")
             synthesis = await self.synthesis_agent.synthesize_findings(
                 query=state["query"],
                 scored_results=scored_results,
                 term_analysis=analysis,
-                iteration_history=iteration_history
+                iteration_history=iteration_history,
+                on_update=stream_callback
             )
             
-            state["synthesis"] = synthesis
-            
             # Structure the final response
             final_response = {
                 "success": True,
@@ -345,61 +462,40 @@ class ClinicalWorkflow:
                 "result_quality": state.get("result_quality", 0)
             }
             
-            state["final_response"] = final_response
+            return {"synthesis": synthesis, "final_response": final_response}
             
         except Exception as e:
             logger.error(f"Error in response synthesis: {e}")
             # Fallback to basic response
             results = state.get("scored_results", state.get("retrieval_results", {}))
-            state["final_response"] = {
-                "success": True,
-                "query": state["query"],
-                "term_type": analysis.get("term_type"),
-                "confidence": analysis.get("confidence"),
-                "reasoning": analysis.get("reasoning"),
-                "total_matches": results.get("total_matches", 0),
-                "datasets_searched": results.get("datasets_searched", 0),
-                "codes_by_system": self._organize_by_coding_system(results),
-                "synthesis": {"executive_summary": "Unable to generate detailed synthesis"},
-                "error_details": str(e)
+            return {
+                "final_response": {
+                    "success": True,
+                    "query": state["query"],
+                    "term_type": analysis.get("term_type"),
+                    "confidence": analysis.get("confidence"),
+                    "reasoning": analysis.get("reasoning"),
+                    "total_matches": results.get("total_matches", 0),
+                    "datasets_searched": results.get("datasets_searched", 0),
+                    "codes_by_system": self._organize_by_coding_system(results),
+                    "synthesis": {"executive_summary": "Unable to generate detailed synthesis"},
+                    "error_details": str(e)
+                }
             }
-        
-        return state
     
     def _organize_by_coding_system(self, results: Dict[str, Any]) -> Dict[str, List[Dict[str, str]]]:
-        """Organize results by coding system for better presentation"""
-        organized = {}
-        
-        coding_system_names = {
-            "icd10cm": "ICD-10-CM",
-            "icd11": "ICD-11",
-            "icd9cm_dx": "ICD-9-CM Diagnoses",
-            "icd9cm_sg": "ICD-9-CM Procedures",
-            "loinc": "LOINC",
-            "rxterms": "RxTerms",
-            "drugs": "Drugs",
-            "hcpcs": "HCPCS",
-            "ucum": "UCUM",
-            "hpo": "HPO",
-            "conditions": "Medical Conditions",
-            "procedures": "Procedures",
-            "clinvar": "ClinVar",
-            "genes": "Genes",
-            "snps": "SNPs",
-            "genetic_diseases": "Genetic Diseases",
-            "pharmvar": "PharmVar",
-            "npi_idv": "NPI (Individuals)",
-            "npi_org": "NPI (Organizations)"
-        }
+        """
+        Organize results by coding system for better presentation
+        
+        Every entry carries code, description, dataset, relevance_score and
+        relevance_level, so display code can index them directly.
+        """
+        organized = defaultdict(list)
+        system_name_for = CODING_SYSTEM_NAMES.get
         
         for dataset, data in results.get("results", {}).items():
-            system_name = coding_system_names.get(dataset, dataset.upper())
-            
-            # Append results to system name, handling duplicates
-            if system_name not in organized:
-                organized[system_name] = []
-            
-            organized[system_name].extend([
+            # Datasets sharing a system name are appended to the same list
+            organized[system_name_for(dataset, dataset.upper())].extend(
                 {
                     "code": item.get("code", "N/A"),
                     "description": item.get("description", "No description available"),
@@ -407,24 +503,33 @@ class ClinicalWorkflow:
                     "relevance_score": item.get("relevance_score"),
                     "relevance_level": item.get("relevance_level")
                 }
-                for item in data.get("results", [])
-            ])
+                for item in data.get("results", ())
+            )
         
-        return organized
+        return dict(organized)
     
-    async def run(self, query: str) -> Dict[str, Any]:
+    async def run(
+        self,
+        query: str,
+        stream_callback: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        term_analysis: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
         Run the iterative agentic workflow for a clinical term lookup
         
         Args:
             query: The clinical term to look up
+            stream_callback: Optional async callback awaited with each partial
+                synthesis while it streams (time-to-first-field rendering)
+            term_analysis: Optional precomputed term analysis; skips the
+                analysis step when given
             
         Returns:
             Dictionary with lookup results including synthesis and iteration history
         """
         initial_state: ClinicalQueryState = {
             "query": query,
-            "term_analysis": None,
+            "term_analysis": term_analysis,
             "retrieval_results": None,
             "scored_results": None,
             "synthesis": None,
@@ -440,7 +545,10 @@ class ClinicalWorkflow:
         logger.info(f"Starting agentic workflow for query: {query}")
         
         try:
-            final_state = await self.workflow.ainvoke(initial_state)
+            final_state = await self.workflow.ainvoke(
+                initial_state,
+                config={"configurable": {"stream_callback": stream_callback}}
+            )
             result = final_state.get("final_response", {})
             
             logger.info(
@@ -456,3 +564,58 @@ class ClinicalWorkflow:
                 "error": str(e),
                 "query": query
             }
+    
+    async def run_many(self, queries: List[str], batch_size: int = 8) -> List[Dict[str, Any]]:
+        """
+        Run lookups for several queries, analyzing their terms in batches
+        
+        Term analysis asks the LLM about up to batch_size queries per call;
+        the lookups then run concurrently and share the API and LLM caches.
+        
+        Args:
+            queries: Clinical terms to look up
+            batch_size: Maximum queries per term analysis LLM call
+            
+        Returns:
+            Lookup results in the same order as queries
+        """
+        try:
+            analyses = await self.terminology_agent.analyze_batch(queries, batch_size=batch_size)
+        except Exception as e:
+            logger.error(f"Batch term analysis failed: {e}")
+            analyses = [None] * len(queries)
+        
+        return await asyncio.gather(*[
+            self.run(query, term_analysis=analysis)
+            for query, analysis in zip(queries, analyses)
+        ])
+    
+    async def run_stream(self, query: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run the workflow, yielding synthesis output as it streams
+        
+        Args:
+            query: The clinical term to look up
+            
+        Yields:
+            ("synthesis", partial synthesis) events, then ("result", response)
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def on_update(partial: Dict[str, Any]):
+            await queue.put(("synthesis", partial))
+        
+        async def produce():
+            # run() reports failures in its response rather than raising
+            await queue.put(("result", await self.run(query, stream_callback=on_update)))
+        
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event[0] == "result":
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
@@ -6,14 +6,22 @@ Interactive system for looking up medical codes across coding systems
 import asyncio
 import logging
 import os
-from typing import Optional
+import threading
+from functools import cached_property
+from typing import Iterator, List, Optional
 from dotenv import load_dotenv
 from agents.terminology_agent import TerminologyAgent
 from agents.retrieval_agent import RetrievalAgent
 from agents.refinement_agent import SearchRefinementAgent
 from agents.scoring_agent import ResultScoringAgent
 from agents.synthesis_agent import SynthesisAgent
-from apis.clinical_tables import ClinicalTablesClient
+from agents.llm_pool import get_embeddings_model
+from apis.clinical_tables import (
+    ClinicalTablesClient,
+    close_session,
+    load_prefetch_terms,
+    remember_prefetch_term
+)
 from graph.clinical_workflow import ClinicalWorkflow
 from memory.conversation_memory import ConversationMemory
 from config import config
@@ -28,6 +36,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Display labels for relevance levels
+RELEVANCE_LABELS = {
+    "high": "[HIGH]",
+    "medium": "[MEDIUM]",
+    "low": "[LOW]",
+    "very_low": "[VERY LOW]"
+}
+
+# Interactive mode commands
+QUIT_COMMANDS = frozenset({"quit", "exit", "q"})
+CLEAR_CACHE_COMMANDS = frozenset({"clear cache", "clear", "reset cache"})
+
+# Disclaimer shown after every page of results
+DISCLAIMER = "\n".join([
+    "This AI-powered tool is for informational and research purposes only.",
+    "",
+    "LIMITATIONS:",
+    "  - AI-generated analysis may contain errors or inaccuracies",
+    "  - Medical codes and recommendations require verification",
+    "  - Not a substitute for professional medical judgment",
+    "  - Clinical Tables API data quality may vary by dataset",
+    "",
+    "REQUIRED ACTIONS:",
+    "  - All results MUST be reviewed by qualified healthcare professionals",
+    "  - Verify all medical codes against official coding guidelines",
+    "  - Consult current ICD, LOINC, and other official coding manuals",
+    "  - Do not use for direct patient care without human oversight",
+    "",
+    "COMPLIANCE:",
+    "  - Users are responsible for HIPAA compliance and data privacy",
+    "  - No PHI (Protected Health Information) should be entered into this system",
+    "  - Medical liability rests with the healthcare provider, not this tool",
+    "=" * 80
+])
+
+
+async def read_input(prompt: str) -> str:
+    """
+    Read a line from stdin without blocking the event loop
+    
+    input() runs on a daemon thread, so background tasks (workflow build,
+    cache warm-up) make progress while the user types, and a prompt left
+    waiting at shutdown never holds up interpreter exit.
+    
+    Args:
+        prompt: Prompt shown before reading
+        
+    Returns:
+        The line read, without the trailing newline
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def deliver(error: Optional[Exception], line: str):
+        # Runs on the loop; the awaiting caller may have been cancelled
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(line)
+    
+    def read():
+        try:
+            line = input(prompt)
+        except Exception as e:
+            loop.call_soon_threadsafe(deliver, e, "")
+        else:
+            loop.call_soon_threadsafe(deliver, None, line)
+    
+    threading.Thread(target=read, name="stdin-reader", daemon=True).start()
+    return await future
+
 
 class ClinicalTermLookup:
     """Main application class for clinical term lookup"""
@@ -41,26 +122,76 @@ class ClinicalTermLookup:
         
         os.environ["OPENAI_API_KEY"] = self.api_key
         
-        # Initialize components
+        # Agents and the workflow are built on first use (see the properties
+        # below), so cache hits and commands never construct LLM clients
         self.client = ClinicalTablesClient()
-        self.terminology_agent = TerminologyAgent()
-        self.retrieval_agent = RetrievalAgent(self.client)
-        self.refinement_agent = SearchRefinementAgent()
-        self.scoring_agent = ResultScoringAgent()
-        self.synthesis_agent = SynthesisAgent()
         
-        self.workflow = ClinicalWorkflow(
+        # Initialize conversation memory for pagination
+        self.memory = ConversationMemory(
+            config.display.QUERY_CACHE_DISK_DIR,
+            config.display.QUERY_CACHE_DISK_TTL
+        )
+        
+        # Background construction of the workflow (see prepare_workflow)
+        self._workflow_build: Optional[asyncio.Future] = None
+        
+        logger.info("Clinical Term Lookup System initialized")
+    
+    @cached_property
+    def terminology_agent(self) -> TerminologyAgent:
+        return TerminologyAgent()
+    
+    @cached_property
+    def retrieval_agent(self) -> RetrievalAgent:
+        return RetrievalAgent(self.client)
+    
+    @cached_property
+    def refinement_agent(self) -> SearchRefinementAgent:
+        return SearchRefinementAgent()
+    
+    @cached_property
+    def scoring_agent(self) -> ResultScoringAgent:
+        return ResultScoringAgent()
+    
+    @cached_property
+    def synthesis_agent(self) -> SynthesisAgent:
+        return SynthesisAgent()
+    
+    @cached_property
+    def workflow(self) -> ClinicalWorkflow:
+        """Workflow wired to the agents; built on the first uncached lookup"""
+        return ClinicalWorkflow(
             self.terminology_agent,
             self.retrieval_agent,
             self.refinement_agent,
             self.scoring_agent,
             self.synthesis_agent
         )
+    
+    def prepare_workflow(self) -> asyncio.Future:
+        """
+        Start building the agents and workflow in a worker thread
         
-        # Initialize conversation memory for pagination
-        self.memory = ConversationMemory()
+        Constructing the LLM clients is synchronous and slow on a cold start;
+        running it off the event loop lets it overlap with waiting for the
+        first query. The build is submitted to the loop's default thread
+        pool immediately, so it starts even before the caller next awaits.
+        Safe to call more than once.
         
-        logger.info("Clinical Term Lookup System initialized")
+        Returns:
+            Future resolving to the workflow
+        """
+        if self._workflow_build is None:
+            self._workflow_build = asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.workflow
+            )
+        return self._workflow_build
+    
+    async def _get_workflow(self) -> ClinicalWorkflow:
+        """Get the workflow, waiting for (or starting) its background build"""
+        if "workflow" in self.__dict__:
+            return self.workflow
+        return await self.prepare_workflow()
     
     async def lookup(self, term: str, check_continuation: bool = True) -> dict:
         """
@@ -90,96 +221,165 @@ class ClinicalTermLookup:
                     "last_query": self.memory.last_query
                 }
         
-        # Check if we have cached results for this exact query
-        if self.memory.is_cached_query(term):
-            cached_results = self.memory.get_cached_results(term)
-            if cached_results:
-                logger.info(f"Returning cached results for: {term}")
-                
-                # Add fresh pagination info for display
-                codes_by_system = cached_results.get("codes_by_system", {})
-                pagination_info = {}
-                for system_name, codes in codes_by_system.items():
-                    total = len(codes)
-                    shown = min(config.display.MAX_CODES_PER_SYSTEM, total)
-                    pagination_info[system_name] = {
-                        "start": 1,
-                        "end": shown,
-                        "total": total
-                    }
-                cached_results["pagination_info"] = pagination_info
-                
-                # Store in memory for pagination
+        # Check if we have cached results for this exact query (one lookup, None on miss)
+        cached_results = self.memory.get_cached_results(term)
+        
+        # Otherwise try a paraphrase of an earlier query; the embedding is
+        # computed alongside the workflow when there is nothing to compare to
+        embedding_task = None
+        if cached_results is None and config.llm.SEMANTIC_CACHE_ENABLED:
+            embedding_task = asyncio.create_task(self._embed_query(term))
+            if self.memory.query_embeddings:
+                embedding = await embedding_task
+                if embedding is not None:
+                    cached_results = self.memory.get_similar_results(
+                        term, embedding, config.llm.SEMANTIC_CACHE_THRESHOLD
+                    )
+        
+        if cached_results is not None:
+            logger.info(f"Returning cached results for: {term}")
+            
+            # Pagination info for the first page is cached with the results
+            if "pagination_info" not in cached_results:
+                cached_results["pagination_info"] = self._first_page_info(
+                    cached_results.get("codes_by_system", {})
+                )
+            
+            # Store in memory for pagination, unless this query's first page
+            # is already the pagination state
+            if self.memory.last_query != term or self.memory.current_page != 0:
                 self.memory.store_results(
                     term, 
                     cached_results, 
                     config.display.MAX_CODES_PER_SYSTEM
                 )
-                
-                return cached_results
+            
+            return cached_results
         
         logger.info(f"Looking up: {term}")
         
+        workflow = await self._get_workflow()
         async with self.client:
-            result = await self.workflow.run(term)
+            result = await workflow.run(term)
         
         # Store results in memory for potential pagination
         if result.get("success"):
-            # Cache the full query results
-            self.memory.cache_query_results(term, result)
+            embedding = await embedding_task if embedding_task is not None else None
+            self._cache_result(term, result, embedding)
             
             self.memory.store_results(
                 term, 
                 result, 
                 config.display.MAX_CODES_PER_SYSTEM
             )
+        elif embedding_task is not None:
+            embedding_task.cancel()
+        
+        return result
+    
+    async def lookup_many(self, terms: List[str]) -> List[dict]:
+        """
+        Look up several clinical terms concurrently
+        
+        Cached terms are answered from memory; the rest run through the
+        workflow together, sharing one client session and batching their
+        term analysis.
+        
+        Args:
+            terms: Clinical terms to look up
             
-            # Check if there are more pages available and add pagination info
-            codes_by_system = result.get("codes_by_system", {})
-            has_more = any(
-                len(codes) > config.display.MAX_CODES_PER_SYSTEM 
-                for codes in codes_by_system.values()
-            )
-            result["has_more_pages"] = has_more
+        Returns:
+            Result dictionaries in the same order as terms
+        """
+        results = [self.memory.get_cached_results(term) for term in terms]
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        if pending:
+            logger.info(f"Looking up {len(pending)} terms concurrently")
+            workflow = await self._get_workflow()
+            async with self.client:
+                fresh = await workflow.run_many([terms[i] for i in pending])
             
-            # Add pagination info for first page
-            pagination_info = {}
-            for system_name, codes in codes_by_system.items():
-                total = len(codes)
-                shown = min(config.display.MAX_CODES_PER_SYSTEM, total)
-                pagination_info[system_name] = {
-                    "start": 1,
-                    "end": shown,
-                    "total": total
-                }
-            result["pagination_info"] = pagination_info
+            for i, result in zip(pending, fresh):
+                if result.get("success"):
+                    self._cache_result(terms[i], result)
+                results[i] = result
         
-        return result
+        return results
+    
+    async def _embed_query(self, term: str) -> Optional[List[float]]:
+        """Embed a query for the semantic cache; None if embedding fails"""
+        try:
+            embeddings = get_embeddings_model(
+                config.llm.EMBEDDING_MODEL,
+                config.llm.EMBEDDING_DIMENSIONS
+            )
+            return await embeddings.aembed_query(" ".join(term.lower().split()))
+        except Exception as e:
+            logger.warning(f"Query embedding failed: {e}")
+            return None
+    
+    def _cache_result(self, term: str, result: dict, embedding: Optional[List[float]] = None):
+        """Add first-page pagination to a fresh result and cache it"""
+        remember_prefetch_term(term)
+        
+        # Check if there are more pages available and add pagination info
+        codes_by_system = result.get("codes_by_system", {})
+        result["has_more_pages"] = any(
+            len(codes) > config.display.MAX_CODES_PER_SYSTEM 
+            for codes in codes_by_system.values()
+        )
+        result["pagination_info"] = self._first_page_info(codes_by_system)
+        
+        # Cache the full query results, including first-page pagination
+        self.memory.cache_query_results(term, result, embedding)
+    
+    def _first_page_info(self, codes_by_system: dict) -> dict:
+        """Build pagination info for the first page of each coding system"""
+        pagination_info = {}
+        for system_name, codes in codes_by_system.items():
+            total = len(codes)
+            shown = min(config.display.MAX_CODES_PER_SYSTEM, total)
+            pagination_info[system_name] = {
+                "start": 1,
+                "end": shown,
+                "total": total
+            }
+        return pagination_info
     
     def format_results(self, results: dict) -> str:
         """Format results for display with synthesis and quality metrics"""
+        return "\n".join(self.iter_format_results(results))
+    
+    def iter_format_results(self, results: dict) -> Iterator[str]:
+        """
+        Yield the formatted display line by line
+        
+        Callers printing to a terminal can write each line as it is produced;
+        format_results joins them into one string.
+        """
         if not results.get("success"):
             # Check if this is end of pagination
             if results.get("is_end_of_results"):
-                return (
+                yield (
                     f"\nNo more results available.\n"
                     f"All codes for '{results.get('last_query')}' have been displayed.\n"
                 )
-            return f"Error: {results.get('error', 'Unknown error')}\n"
-        
-        output = []
+            else:
+                yield f"Error: {results.get('error', 'Unknown error')}\n"
+            return
         
         # Header section - different for continuation pages
         if results.get("is_continuation"):
-            output.append("=" * 80)
-            output.append(f"Query: {results['query']} (CONTINUED - Page {results.get('page_number', 1)})")
-            output.append(f"Showing codes {results.get('total_codes_shown', 0)} more codes...")
-            output.append("=" * 80)
-            output.append("")
+            yield "=" * 80
+            yield f"Query: {results['query']} (CONTINUED - Page {results.get('page_number', 1)})"
+            yield f"Showing codes {results.get('total_codes_shown', 0)} more codes..."
+            yield "=" * 80
+            yield ""
         else:
-            output.append("=" * 80)
-            output.append(f"Query: {results['query']}")
-            output.append(f"Term Type: {results.get('term_type', 'Unknown')}")
+            yield "=" * 80
+            yield f"Query: {results['query']}"
+            yield f"Term Type: {results.get('term_type', 'Unknown')}"
             
             # Show cache indicator
             if results.get("from_cache"):
@@ -188,12 +388,14 @@ class ClinicalTermLookup:
                     age_str = f"{cache_age:.0f} seconds"
                 else:
                     age_str = f"{cache_age/60:.1f} minutes"
-                output.append(f"Source: Cached results (age: {age_str})")
-                output.append("Note: No API calls or LLM processing - instant retrieval")
-            output.append(f"Confidence: {results.get('confidence', 0):.2%}")
-            output.append(f"Reasoning: {results.get('reasoning', 'N/A')}")
-            output.append("=" * 80)
-            output.append("")
+                yield f"Source: Cached results (age: {age_str})"
+                if results.get("matched_query"):
+                    yield f"Matched similar query: {results['matched_query']}"
+                yield "Note: No API calls or LLM processing - instant retrieval"
+            yield f"Confidence: {results.get('confidence', 0):.2%}"
+            yield f"Reasoning: {results.get('reasoning', 'N/A')}"
+            yield "=" * 80
+            yield ""
         
         # Agentic metrics (skip for continuation pages)
         if not results.get("is_continuation") and config.display.SHOW_QUALITY_METRICS:
@@ -202,57 +404,60 @@ class ClinicalTermLookup:
             quality_metrics = results.get("quality_metrics", {})
             primary_datasets = results.get("primary_datasets", [])
             
-            output.append("AGENTIC WORKFLOW METRICS")
-            output.append("-" * 80)
+            yield "AGENTIC WORKFLOW METRICS"
+            yield "-" * 80
             
             # Dataset selection strategy
             if primary_datasets:
                 dataset_names = [ds.upper().replace("_", "-") for ds in primary_datasets]
-                output.append(f"  Dataset Selection: {len(dataset_names)} systems chosen based on term type '{results.get('term_type', 'unknown')}'")
-                output.append(f"  Selected Systems: {', '.join(dataset_names)}")
+                yield f"  Dataset Selection: {len(dataset_names)} systems chosen based on term type '{results.get('term_type', 'unknown')}'"
+                yield f"  Selected Systems: {', '.join(dataset_names)}"
             
-            output.append(f"  Iterations Performed: {iteration_count}")
-            output.append(f"  Result Quality Score: {result_quality:.2%}")
-            output.append(f"  Total Matches: {results.get('total_matches', 0)}")
-            output.append(f"  Average Relevance: {quality_metrics.get('avg_relevance', 0):.2%}")
-            output.append(f"  High Quality Results: {quality_metrics.get('high_quality_count', 0)}")
-            output.append("")
+            yield f"  Iterations Performed: {iteration_count}"
+            yield f"  Result Quality Score: {result_quality:.2%}"
+            yield f"  Total Matches: {results.get('total_matches', 0)}"
+            yield f"  Average Relevance: {quality_metrics.get('avg_relevance', 0):.2%}"
+            yield f"  High Quality Results: {quality_metrics.get('high_quality_count', 0)}"
+            yield ""
         
         # Iteration history (skip for continuation pages)
         if not results.get("is_continuation") and config.display.SHOW_ITERATION_HISTORY:
             iteration_history = results.get("iteration_history", [])
             if len(iteration_history) > 1:
-                output.append("ITERATION HISTORY")
-                output.append("-" * 80)
+                yield "ITERATION HISTORY"
+                yield "-" * 80
                 for hist in iteration_history:
-                    output.append(
+                    yield (
                         f"  Iteration {hist['iteration']}: "
                         f"{hist['total_matches']} matches, "
                         f"quality={hist['quality_score']:.2f}, "
                         f"avg_relevance={hist['avg_relevance']:.2f}"
                     )
-                output.append("")
+                yield ""
         
         # Synthesis (skip for continuation pages)
         if not results.get("is_continuation") and config.display.SHOW_SYNTHESIS:
             synthesis = results.get("synthesis", {})
             if synthesis:
-                output.append(self.synthesis_agent.format_synthesis_for_display(synthesis))
-                output.append("")
+                # Through the class: a cached page must not build the agent
+                yield SynthesisAgent.format_synthesis_for_display(synthesis)
+                yield ""
         
         # Detailed codes by system
         codes_by_system = results.get("codes_by_system", {})
         
         if not codes_by_system:
-            output.append("No codes found in any coding system.")
-            return "\n".join(output)
+            yield "No codes found in any coding system."
+            return
         
-        output.append(f"DETAILED CODES ({len(codes_by_system)} coding system(s))")
-        output.append("=" * 80)
-        output.append("")
+        yield f"DETAILED CODES ({len(codes_by_system)} coding system(s))"
+        yield "=" * 80
+        yield ""
         
         # Get pagination info
         pagination_info = results.get("pagination_info", {})
+        show_relevance = config.display.SHOW_RELEVANCE_SCORES
+        max_codes = config.display.MAX_CODES_PER_SYSTEM
         
         for system_name, codes in codes_by_system.items():
             # Get range information for this system
@@ -261,66 +466,43 @@ class ClinicalTermLookup:
                 start = page_info.get("start", 1)
                 end = page_info.get("end", len(codes))
                 total = page_info.get("total", len(codes))
-                output.append(f"{system_name} (showing {start}-{end} of {total} results)")
+                yield f"{system_name} (showing {start}-{end} of {total} results)"
             else:
-                output.append(f"{system_name} ({len(codes)} results)")
-            output.append("-" * 80)
+                yield f"{system_name} ({len(codes)} results)"
+            yield "-" * 80
             
-            for i, code_info in enumerate(codes[:config.display.MAX_CODES_PER_SYSTEM], 1):
-                code = code_info.get("code", "N/A")
-                desc = code_info.get("description", "No description")
-                relevance = code_info.get("relevance_score")
-                relevance_level = code_info.get("relevance_level", "unknown")
+            # Entries are built with every field by the workflow, so they are
+            # read directly rather than through .get() defaults
+            display_codes = codes[:max_codes]
+            for i, code_info in enumerate(display_codes, 1):
+                code = code_info["code"]
+                desc = code_info["description"]
+                relevance = code_info["relevance_score"]
                 
-                # Relevance indicator
-                if config.display.SHOW_RELEVANCE_SCORES and relevance is not None:
-                    relevance_label = {
-                        "high": "[HIGH]",
-                        "medium": "[MEDIUM]",
-                        "low": "[LOW]",
-                        "very_low": "[VERY LOW]"
-                    }.get(relevance_level, "")
-                    output.append(f"  {i}. {relevance_label} Code: {code} (Relevance: {relevance:.2f})")
+                # Relevance indicator; each code is one block of output
+                if show_relevance and relevance is not None:
+                    relevance_label = RELEVANCE_LABELS.get(code_info["relevance_level"], "")
+                    yield (
+                        f"  {i}. {relevance_label} Code: {code} (Relevance: {relevance:.2f})\n"
+                        f"     Description: {desc}\n"
+                    )
                 else:
-                    output.append(f"  {i}. Code: {code}")
-                
-                output.append(f"     Description: {desc}")
-                output.append("")
+                    yield f"  {i}. Code: {code}\n     Description: {desc}\n"
         
         # Pagination hint
         if results.get("has_more_pages"):
-            output.append("")
-            output.append("TIP: More results available!")
-            output.append("     Type 'more', 'next', or 'show more' to see additional codes.")
-            output.append("")
+            yield ""
+            yield "TIP: More results available!"
+            yield "     Type 'more', 'next', or 'show more' to see additional codes."
+            yield ""
         
         # Add disclaimer (only for first page)
         if not results.get("is_continuation"):
-            output.append("")
-            output.append("=" * 80)
-            output.append("IMPORTANT DISCLAIMER")
-            output.append("=" * 80)
-        output.append("This AI-powered tool is for informational and research purposes only.")
-        output.append("")
-        output.append("LIMITATIONS:")
-        output.append("  - AI-generated analysis may contain errors or inaccuracies")
-        output.append("  - Medical codes and recommendations require verification")
-        output.append("  - Not a substitute for professional medical judgment")
-        output.append("  - Clinical Tables API data quality may vary by dataset")
-        output.append("")
-        output.append("REQUIRED ACTIONS:")
-        output.append("  - All results MUST be reviewed by qualified healthcare professionals")
-        output.append("  - Verify all medical codes against official coding guidelines")
-        output.append("  - Consult current ICD, LOINC, and other official coding manuals")
-        output.append("  - Do not use for direct patient care without human oversight")
-        output.append("")
-        output.append("COMPLIANCE:")
-        output.append("  - Users are responsible for HIPAA compliance and data privacy")
-        output.append("  - No PHI (Protected Health Information) should be entered into this system")
-        output.append("  - Medical liability rests with the healthcare provider, not this tool")
-        output.append("=" * 80)
-        
-        return "\n".join(output)
+            yield ""
+            yield "=" * 80
+            yield "IMPORTANT DISCLAIMER"
+            yield "=" * 80
+        yield DISCLAIMER
     
     async def interactive_mode(self):
         """Run in interactive mode"""
@@ -333,23 +515,27 @@ class ClinicalTermLookup:
         print("Special commands: 'clear cache' to clear query cache")
         print("Type 'quit' or 'exit' to stop.\n")
         
+        # Build the agents while the user types the first query
+        self.prepare_workflow()
+        
         while True:
             try:
-                term = input("Enter clinical term: ").strip()
+                term = (await read_input("Enter clinical term: ")).strip()
+                term_lower = term.lower()
                 
-                if term.lower() in ['quit', 'exit', 'q']:
+                if term_lower in QUIT_COMMANDS:
                     print("\nGoodbye!")
                     break
                 
                 # Check for special commands
-                if term.lower() in ['clear cache', 'clear', 'reset cache']:
+                if term_lower in CLEAR_CACHE_COMMANDS:
                     cache_size = len(self.memory.query_cache)
                     self.memory.clear_cache()
                     print(f"\nCleared query cache ({cache_size} entries removed)")
                     print("All future queries will be processed fresh.\n")
                     continue
                 
-                if term.lower() == 'cache status':
+                if term_lower == 'cache status':
                     summary = self.memory.get_summary()
                     print(f"\nCache Status:")
                     print(f"  Cached queries: {summary['cache_size']}")
@@ -371,10 +557,13 @@ class ClinicalTermLookup:
                     print(f"\nRetrieving cached results for '{term}'...\n")
                 
                 results = await self.lookup(term)
-                print(self.format_results(results))
+                for line in self.iter_format_results(results):
+                    print(line)
                 print("\n")
                 
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+                # Ctrl+C cancels the awaiting task under asyncio.run; Ctrl+D
+                # (or a closed stdin) ends input
                 print("\n\nGoodbye!")
                 break
             except Exception as e:
@@ -384,6 +573,7 @@ class ClinicalTermLookup:
 
 async def main():
     """Main entry point"""
+    warm_task = None
     try:
         # Check for API key
         if not os.getenv("OPENAI_API_KEY"):
@@ -397,18 +587,37 @@ async def main():
         
         # Check if running with command-line argument
         import sys
-        if len(sys.argv) > 1:
+        if len(sys.argv) > 2 and sys.argv[1] == "--batch":
+            # Batch mode: each argument is a separate term, looked up concurrently
+            for results in await lookup_system.lookup_many(sys.argv[2:]):
+                for line in lookup_system.iter_format_results(results):
+                    print(line)
+        elif len(sys.argv) > 1:
             # Single lookup mode
             term = " ".join(sys.argv[1:])
             results = await lookup_system.lookup(term)
-            print(lookup_system.format_results(results))
+            for line in lookup_system.iter_format_results(results):
+                print(line)
         else:
+            # Warm the API cache in the background; lookups never wait on it
+            seeds = load_prefetch_terms()
+            if seeds:
+                warm_task = asyncio.create_task(lookup_system.client.warm(
+                    seeds,
+                    config.api.PREFETCH_DATASETS.split(","),
+                    config.display.MAX_CODES_PER_SYSTEM
+                ))
+            
             # Interactive mode
             await lookup_system.interactive_mode()
             
     except Exception as e:
         logger.error(f"Fatal error: {e}")
         print(f"\nFatal error: {e}")
+    finally:
+        if warm_task is not None:
+            warm_task.cancel()
+        await close_session()
 
 
 if __name__ == "__main__":
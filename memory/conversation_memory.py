@@ -3,10 +3,18 @@ Conversation Memory Module
 Maintains conversation history and supports pagination of previous results
 """
 
-import hashlib
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Sequence, Tuple
+from datetime import datetime
+
+try:
+    import diskcache
+except ImportError:  # Persistent query cache is optional
+    diskcache = None
 
 logger = logging.getLogger(__name__)
 
@@ -20,36 +28,105 @@ class ConversationMemory:
         "rest", "others", "see more", "keep going", "more results",
         "show all", "full list", "complete list", "everything"
     ]
+    # All keywords in one scan; word boundaries keep "Baltimore" from matching "more"
+    CONTINUATION_PATTERN = re.compile(
+        r"\b(?:" + "|".join(re.escape(keyword) for keyword in CONTINUATION_KEYWORDS) + r")\b"
+    )
+    # Bare keywords (the common case) are answered without the regex scan
+    CONTINUATION_EXACT = frozenset(CONTINUATION_KEYWORDS)
     
     # Cache TTL for full query results (in seconds)
     QUERY_CACHE_TTL = 3600  # 1 hour
+    # Least recently used queries are evicted beyond this many entries
+    QUERY_CACHE_MAX_SIZE = 100
     
-    def __init__(self):
-        """Initialize conversation memory"""
+    def __init__(self, disk_cache_dir: Optional[str] = None, disk_cache_ttl: int = 86400):
+        """
+        Initialize conversation memory
+        
+        Args:
+            disk_cache_dir: Directory for a persistent query cache tier shared
+                across processes (requires diskcache); None keeps the cache
+                in memory only
+            disk_cache_ttl: Seconds persisted query results stay valid
+        """
         self.last_query: Optional[str] = None
         self.last_results: Optional[Dict[str, Any]] = None
         self.current_page: int = 0
         self.codes_per_page: int = 5  # Default, will be updated from config
         self.query_timestamp: Optional[datetime] = None
         
-        # Query result cache: {query_hash: (results, timestamp)}
-        self.query_cache: Dict[str, tuple[Dict[str, Any], datetime]] = {}
+        # Per-system code counts and page count of last_results, computed
+        # once in store_results so paging is only slice arithmetic
+        self.system_totals: Dict[str, int] = {}
+        self.total_codes: int = 0
+        self.page_count: int = 0
+        
+        # Query result cache in LRU order: {normalized query: (results, cached_at)}
+        # where cached_at is a time.monotonic() reading, immune to clock changes
+        self.query_cache: OrderedDict[str, tuple[Dict[str, Any], float]] = OrderedDict()
+        
+        # Unit-length query embeddings for semantic lookups: {normalized query: vector}
+        self.query_embeddings: Dict[str, Tuple[float, ...]] = {}
+        
+        # Cold tier: {normalized query: (results, time.time() when cached)}
+        self.disk = None
+        self.disk_cache_ttl = disk_cache_ttl
+        if diskcache is not None and disk_cache_dir:
+            self.disk = diskcache.Cache(disk_cache_dir)
         
         logger.info("Conversation memory initialized with query result caching")
     
-    def _generate_query_hash(self, query: str) -> str:
+    def _normalize_query(self, query: str) -> str:
         """
-        Generate a hash for query caching
+        Normalize a query for use as a cache key
+        
+        The cache lives in process memory, so the normalized string is used
+        as the key directly rather than a digest of it.
         
         Args:
             query: User query string
             
         Returns:
-            MD5 hash of normalized query
+            Lowercased query without surrounding whitespace
         """
-        # Normalize query: lowercase, strip whitespace
-        normalized = query.lower().strip()
-        return hashlib.md5(normalized.encode()).hexdigest()
+        return query.lower().strip()
+    
+    def _get_valid_entry(self, key: str, query: str) -> Optional[tuple[Dict[str, Any], float]]:
+        """Return the cache entry for a key, dropping it if it has expired"""
+        entry = self.query_cache.get(key)
+        if entry is None:
+            return self._disk_get(key)
+        
+        # Check if cache is still valid (within TTL)
+        if time.monotonic() - entry[1] > self.QUERY_CACHE_TTL:
+            # Cache expired, remove it; the disk tier may still hold it
+            del self.query_cache[key]
+            self.query_embeddings.pop(key, None)
+            logger.info(f"Query cache expired for: {query[:50]}")
+            return self._disk_get(key)
+        
+        return entry
+    
+    def _disk_get(self, key: str) -> Optional[tuple[Dict[str, Any], float]]:
+        """Promote a persisted entry into the in-memory cache"""
+        if self.disk is None:
+            return None
+        try:
+            stored = self.disk.get(key)
+        except Exception as e:
+            logger.warning(f"Query disk cache read failed: {e}")
+            return None
+        if stored is None:
+            return None
+        
+        # Expiry is enforced by diskcache; carry the entry's age over to the
+        # monotonic clock so cache_age_seconds stays accurate
+        results, cached_at = stored
+        age = max(0.0, time.time() - cached_at)
+        entry = (results, time.monotonic() - age)
+        self._memory_set(key, entry)
+        return entry
     
     def is_cached_query(self, query: str) -> bool:
         """
@@ -61,22 +138,7 @@ class ConversationMemory:
         Returns:
             True if valid cached results exist
         """
-        query_hash = self._generate_query_hash(query)
-        
-        if query_hash not in self.query_cache:
-            return False
-        
-        # Check if cache is still valid (within TTL)
-        _, timestamp = self.query_cache[query_hash]
-        age = datetime.now() - timestamp
-        
-        if age.total_seconds() > self.QUERY_CACHE_TTL:
-            # Cache expired, remove it
-            del self.query_cache[query_hash]
-            logger.info(f"Query cache expired for: {query[:50]}")
-            return False
-        
-        return True
+        return self._get_valid_entry(self._normalize_query(query), query) is not None
     
     def get_cached_results(self, query: str) -> Optional[Dict[str, Any]]:
         """
@@ -88,51 +150,108 @@ class ConversationMemory:
         Returns:
             Cached results dictionary or None if not found/expired
         """
-        if not self.is_cached_query(query):
+        key = self._normalize_query(query)
+        entry = self._get_valid_entry(key, query)
+        if entry is None:
             return None
         
-        query_hash = self._generate_query_hash(query)
-        results, timestamp = self.query_cache[query_hash]
+        self.query_cache.move_to_end(key)
+        results, cached_at = entry
         
-        age_seconds = (datetime.now() - timestamp).total_seconds()
+        age_seconds = time.monotonic() - cached_at
         logger.info(
             f"Retrieved cached results for query '{query[:50]}' "
             f"(age: {age_seconds:.0f}s)"
         )
         
-        # Add cache metadata
-        cached_results = results.copy()
-        cached_results["from_cache"] = True
+        # Entries are stored already marked from_cache; only the age varies
+        cached_results = dict(results)
         cached_results["cache_age_seconds"] = age_seconds
         
         return cached_results
     
-    def cache_query_results(self, query: str, results: Dict[str, Any]):
+    def get_similar_results(
+        self,
+        query: str,
+        embedding: Sequence[float],
+        threshold: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve cached results for the most similar previous query
+        
+        Args:
+            query: User query string
+            embedding: Embedding of the query
+            threshold: Minimum cosine similarity for a match
+            
+        Returns:
+            Cached results dictionary (with matched_query set) or None
+        """
+        vector = self._unit_vector(embedding)
+        best_key, best_score = None, threshold
+        for key, cached_vector in self.query_embeddings.items():
+            score = sum(map(float.__mul__, vector, cached_vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        
+        if best_key is None:
+            return None
+        
+        cached_results = self.get_cached_results(best_key)
+        if cached_results is not None:
+            logger.info(
+                f"Semantic cache hit for '{query[:50]}': matched '{best_key[:50]}' "
+                f"(similarity: {best_score:.3f})"
+            )
+            cached_results["matched_query"] = best_key
+        return cached_results
+    
+    def _unit_vector(self, embedding: Sequence[float]) -> Tuple[float, ...]:
+        """Scale an embedding to unit length so a dot product is its cosine"""
+        norm = math.sqrt(sum(value * value for value in embedding)) or 1.0
+        return tuple(float(value) / norm for value in embedding)
+    
+    def cache_query_results(
+        self,
+        query: str,
+        results: Dict[str, Any],
+        embedding: Optional[Sequence[float]] = None
+    ):
         """
         Cache full query results
         
         Args:
             query: User query string
             results: Complete results dictionary
+            embedding: Optional query embedding for semantic lookups
         """
-        query_hash = self._generate_query_hash(query)
-        self.query_cache[query_hash] = (results.copy(), datetime.now())
+        key = self._normalize_query(query)
+        results = {**results, "from_cache": True}
+        self._memory_set(key, (results, time.monotonic()))
+        if embedding is not None:
+            self.query_embeddings[key] = self._unit_vector(embedding)
         
         logger.info(
             f"Cached query results for: {query[:50]} "
             f"(cache size: {len(self.query_cache)})"
         )
         
-        # Cleanup old cache entries (keep max 100 queries)
-        if len(self.query_cache) > 100:
-            # Remove oldest entries
-            sorted_items = sorted(
-                self.query_cache.items(), 
-                key=lambda x: x[1][1]  # Sort by timestamp
-            )
-            # Keep only the 50 most recent
-            self.query_cache = dict(sorted_items[-50:])
-            logger.info(f"Cleaned up query cache, kept 50 most recent entries")
+        if self.disk is not None:
+            try:
+                self.disk.set(key, (results, time.time()), expire=self.disk_cache_ttl)
+            except Exception as e:
+                logger.warning(f"Query disk cache write failed: {e}")
+    
+    def _memory_set(self, key: str, entry: tuple[Dict[str, Any], float]):
+        """Store an in-memory entry, evicting least recently used queries"""
+        self.query_cache[key] = entry
+        self.query_cache.move_to_end(key)
+        
+        # Evict least recently used queries beyond the size limit
+        while len(self.query_cache) > self.QUERY_CACHE_MAX_SIZE:
+            evicted, _ = self.query_cache.popitem(last=False)
+            self.query_embeddings.pop(evicted, None)
+            logger.info(f"Evicted least recently used query from cache: {evicted[:50]}")
     
     def is_continuation_request(self, user_input: str) -> bool:
         """
@@ -149,11 +268,13 @@ class ConversationMemory:
         
         # Convert to lowercase for comparison
         input_lower = user_input.lower().strip()
+        if input_lower in self.CONTINUATION_EXACT:
+            return True
         
         # Check for direct continuation keywords
-        if any(keyword in input_lower for keyword in self.CONTINUATION_KEYWORDS):
-            # Make sure it's not a new clinical term that happens to contain "more"
-            # (e.g., "Baltimore criteria" contains "more")
+        if self.CONTINUATION_PATTERN.search(input_lower):
+            # Make sure it's not a new clinical term that happens to contain a
+            # keyword (e.g., "rest tremor of the left hand")
             word_count = len(input_lower.split())
             if word_count <= 3:  # Short phrases are likely continuation requests
                 return True
@@ -175,15 +296,20 @@ class ConversationMemory:
         self.codes_per_page = codes_per_page
         self.query_timestamp = datetime.now()
         
-        # Count total available codes
-        total_codes = 0
+        # Count available codes once for all later pages
         codes_by_system = results.get("codes_by_system", {})
-        for codes in codes_by_system.values():
-            total_codes += len(codes)
+        self.system_totals = {
+            system_name: len(codes) for system_name, codes in codes_by_system.items()
+        }
+        self.total_codes = sum(self.system_totals.values())
+        self.page_count = max(
+            (-(-total // codes_per_page) for total in self.system_totals.values()),
+            default=0
+        )
         
         logger.info(
             f"Stored results for query '{query}': "
-            f"{total_codes} total codes across {len(codes_by_system)} systems"
+            f"{self.total_codes} total codes across {len(codes_by_system)} systems"
         )
     
     def get_next_page(self) -> Optional[Dict[str, Any]]:
@@ -212,55 +338,53 @@ class ConversationMemory:
         if not self.last_results:
             return None
         
-        codes_by_system = self.last_results.get("codes_by_system", {})
-        if not codes_by_system:
+        # Every system is exhausted past the last page
+        if page_number >= self.page_count:
+            logger.info(f"No more results for page {page_number}")
             return None
         
+        codes_by_system = self.last_results.get("codes_by_system", {})
+        start_idx = page_number * self.codes_per_page
+        end_idx = start_idx + self.codes_per_page
+        
         # Calculate pagination for each system
         paginated_results = {}
         pagination_info = {}  # Track range for each system
-        has_more_results = False
         total_shown = 0
-        total_available = 0
         
-        for system_name, all_codes in codes_by_system.items():
-            total_codes_in_system = len(all_codes)
-            total_available += total_codes_in_system
-            
-            start_idx = page_number * self.codes_per_page
-            end_idx = start_idx + self.codes_per_page
+        for system_name, total_codes_in_system in self.system_totals.items():
+            if start_idx >= total_codes_in_system:
+                continue
             
             # Get codes for this page
-            page_codes = all_codes[start_idx:end_idx]
+            page_codes = codes_by_system[system_name][start_idx:end_idx]
+            paginated_results[system_name] = page_codes
+            total_shown += len(page_codes)
             
-            if page_codes:
-                paginated_results[system_name] = page_codes
-                total_shown += len(page_codes)
-                
-                # Store range information for this system
-                pagination_info[system_name] = {
-                    "start": start_idx + 1,  # 1-indexed for display
-                    "end": min(end_idx, total_codes_in_system),
-                    "total": total_codes_in_system
-                }
-                
-                # Check if there are more codes in this system
-                if end_idx < len(all_codes):
-                    has_more_results = True
-        
-        if not paginated_results:
-            logger.info(f"No more results for page {page_number}")
-            return None
+            # Store range information for this system
+            pagination_info[system_name] = {
+                "start": start_idx + 1,  # 1-indexed for display
+                "end": min(end_idx, total_codes_in_system),
+                "total": total_codes_in_system
+            }
         
-        # Create modified results for this page
-        page_results = self.last_results.copy()
-        page_results["codes_by_system"] = paginated_results
-        page_results["pagination_info"] = pagination_info
-        page_results["page_number"] = page_number + 1
-        page_results["is_continuation"] = True
-        page_results["has_more_pages"] = has_more_results
-        page_results["total_codes_shown"] = total_shown
-        page_results["total_codes_available"] = total_available
+        has_more_results = page_number + 1 < self.page_count
+        total_available = self.total_codes
+        
+        # Build the page from the few fields continuation pages display rather
+        # than copying the full result (synthesis, history, metrics, ...)
+        page_results = {
+            "success": True,
+            "query": self.last_results.get("query", self.last_query),
+            "term_type": self.last_results.get("term_type"),
+            "codes_by_system": paginated_results,
+            "pagination_info": pagination_info,
+            "page_number": page_number + 1,
+            "is_continuation": True,
+            "has_more_pages": has_more_results,
+            "total_codes_shown": total_shown,
+            "total_codes_available": total_available
+        }
         
         logger.info(
             f"Retrieved page {page_number + 1}: "
@@ -275,12 +399,18 @@ class ConversationMemory:
         self.last_results = None
         self.current_page = 0
         self.query_timestamp = None
+        self.system_totals = {}
+        self.total_codes = 0
+        self.page_count = 0
         logger.info("Conversation memory reset (query cache preserved)")
     
     def clear_cache(self):
         """Clear the query result cache"""
         cache_size = len(self.query_cache)
         self.query_cache.clear()
+        self.query_embeddings.clear()
+        if self.disk is not None:
+            self.disk.clear()
         logger.info(f"Cleared query cache ({cache_size} entries removed)")
     
     def get_summary(self) -> Dict[str, Any]:
@@ -292,16 +422,13 @@ class ConversationMemory:
                 "cache_enabled": True
             }
         
-        codes_by_system = self.last_results.get("codes_by_system", {}) if self.last_results else {}
-        total_codes = sum(len(codes) for codes in codes_by_system.values())
-        
         return {
             "has_memory": True,
             "last_query": self.last_query,
             "current_page": self.current_page + 1,
             "codes_per_page": self.codes_per_page,
-            "total_systems": len(codes_by_system),
-            "total_codes": total_codes,
+            "total_systems": len(self.system_totals),
+            "total_codes": self.total_codes,
             "timestamp": self.query_timestamp.isoformat() if self.query_timestamp else None,
             "cache_size": len(self.query_cache),
             "cache_enabled": True
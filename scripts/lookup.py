@@ -5,8 +5,12 @@ Allows typing: lookup diabetes
 Instead of: python main.py "diabetes"
 """
 
+import asyncio
+import os
 import sys
-import subprocess
+
+# main.py lives in the project root, one level above this script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 if __name__ == "__main__":
     # Get all arguments after 'lookup' and join them
@@ -20,11 +24,9 @@ if __name__ == "__main__":
         print("  lookup metformin 500 mg")
         sys.exit(1)
     
-    # Run the actual main.py with the query
-    result = subprocess.run(
-        ["python", "main.py", query],
-        cwd=".",
-        capture_output=False  # Let output show directly
-    )
+    # Run main.py's entry point in this interpreter rather than a subprocess,
+    # which would pay for a second interpreter start and all its imports
+    from main import main
     
-    sys.exit(result.returncode)
+    sys.argv = [sys.argv[0], query]
+    asyncio.run(main())
@@ -3,20 +3,59 @@ Test Runner Script
 Convenient script to run different test suites
 """
 
+import os
+import shlex
 import sys
 import subprocess
 from pathlib import Path
 
+# Tools run as "python -m <tool>" with this interpreter, so the active
+# environment's packages are used regardless of PATH
+PYTHON_TOOLS = frozenset({"pytest", "coverage", "mypy", "black", "flake8"})
+
 
 def run_command(cmd, description):
-    """Run a command and display results"""
+    """Run a command (split into argv, no shell) and display results"""
     print("\n" + "=" * 80)
     print(f"Running: {description}")
     print("=" * 80)
-    result = subprocess.run(cmd, shell=True)
+    args = shlex.split(cmd)
+    if args[0] in PYTHON_TOOLS:
+        args = [sys.executable, "-m", *args]
+    result = subprocess.run(args, check=False)
     return result.returncode == 0
 
 
+def xdist_args(dist="loadfile"):
+    """
+    Build pytest-xdist arguments for running tests in parallel
+    
+    Uses PYTEST_WORKERS when set, otherwise leaves two cores free. By default
+    whole files are kept on one worker so tests sharing a client fixture do
+    not open connections on several workers.
+    """
+    workers = os.getenv("PYTEST_WORKERS") or max(1, (os.cpu_count() or 1) - 2)
+    return f"-n {workers} --dist={dist}"
+
+
+def changed_python_files():
+    """
+    Python files changed relative to HEAD (staged or not)
+    
+    Returns:
+        List of paths, or None when git is unavailable or this is not a repo
+    """
+    try:
+        output = subprocess.check_output(
+            ["git", "diff", "--name-only", "--diff-filter=ACMR", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [path for path in output.split() if path.endswith(".py")]
+
+
 def main():
     """Main test runner"""
     if len(sys.argv) < 2:
@@ -26,9 +65,13 @@ def main():
         print("  unit        - Run unit tests only")
         print("  integration - Run integration tests only")
         print("  fast        - Run fast unit tests only")
+        print("  config      - Run the configuration checks (marked fast) in parallel")
         print("  coverage    - Run all tests with coverage report")
-        print("  api         - Run API integration tests (no OPENAI_API_KEY needed)")
-        print("  style       - Check code style with black and flake8")
+        print("  live        - Run tests that call the real LLM (needs OPENAI_API_KEY)")
+        print("  api         - Replay API integration tests from HTTP cassettes (offline)")
+        print("                add --record to (re-)record the cassettes against the live API")
+        print("  style       - Check code style of changed files with black and flake8")
+        print("                add --all to check the whole tree")
         print("  types       - Run type checking with mypy")
         print("\nExamples:")
         print("  python run_tests.py unit")
@@ -37,32 +80,65 @@ def main():
     
     option = sys.argv[1].lower()
     success = True
+    parallel = xdist_args()
+    # Test durations vary widely across the mixed suites, so idle workers take
+    # tests from busy ones; CLINICAL_DIST=loadfile keeps each file (and its
+    # cassettes and shared client) on one worker instead
+    mixed = xdist_args(os.getenv("CLINICAL_DIST", "worksteal"))
     
     if option == "all":
-        success = run_command("pytest -v", "All Tests")
+        success = run_command(f"pytest -v -m 'not live' {mixed}", "All Tests")
     
     elif option == "unit":
-        success = run_command("pytest tests/test_units.py -v", "Unit Tests")
+        # Only the named file is collected, so integration modules are never imported
+        success = run_command(f"pytest tests/test_unit_core.py -v {parallel}", "Unit Tests")
     
     elif option == "integration":
-        success = run_command("pytest tests/test_integration.py -v -m integration", 
-                             "Integration Tests")
+        success = run_command(
+            f"pytest tests/test_integration.py -v -m 'integration and not live' {mixed}",
+            "Integration Tests"
+        )
     
     elif option == "fast":
-        success = run_command("pytest tests/test_units.py -v -m 'not slow'", 
+        success = run_command(f"pytest tests/test_unit_core.py -v -m 'not slow' {parallel}", 
                              "Fast Unit Tests")
     
+    elif option == "config":
+        # Independent asserts on settings read at import, so spread them
+        # test by test rather than keeping the file on one worker
+        success = run_command(
+            f"pytest tests/test_unit_core.py -v -m fast {xdist_args('load')}",
+            "Configuration Tests"
+        )
+    
     elif option == "coverage":
+        # Workers only record data (tagged with the test that ran each line);
+        # pytest-cov combines it and the reports are built once afterwards
         success = run_command(
-            "pytest --cov=. --cov-report=html --cov-report=term-missing",
+            f"pytest -m 'not live' --cov=. --cov-report= --cov-context=test {parallel}",
             "Tests with Coverage"
         )
         if success:
+            run_command("coverage report -m", "Coverage Report")
+            run_command("coverage html --show-contexts", "Coverage HTML Report")
             print("\nCoverage report generated in: htmlcov/index.html")
     
+    elif option == "live":
+        # Deselected everywhere else: these spend OpenAI tokens. Classes marked
+        # forked run each test in a child process; grouping by class keeps
+        # one class per worker
+        success = run_command(
+            f"pytest -v -m live {xdist_args('loadscope')}",
+            "Live LLM Tests"
+        )
+    
     elif option == "api":
+        if "--record" in sys.argv[2:]:
+            # Overrides the replay-only mode set in tests/conftest.py; tests
+            # without a cassette are skipped unless recording
+            os.environ["VCR_RECORD_MODE"] = "all"
         success = run_command(
-            "pytest tests/test_integration.py::TestClinicalTablesAPIIntegration -v",
+            "pytest tests/test_integration.py::TestClinicalTablesAPIIntegration -v -m 'not live'",
             "API Integration Tests"
         )
     
@@ -71,13 +147,21 @@ def main():
         print("Checking Code Style")
         print("=" * 80)
         
-        print("\n1. Running black...")
-        black_ok = subprocess.run(["black", ".", "--check"]).returncode == 0
-        
-        print("\n2. Running flake8...")
-        flake8_ok = subprocess.run(["flake8", "."]).returncode == 0
+        # Only files changed since HEAD, unless --all or outside a git checkout
+        targets = None if "--all" in sys.argv[2:] else changed_python_files()
+        if targets is None:
+            targets = ["."]
         
-        success = black_ok and flake8_ok
+        if not targets:
+            print("\nNo changed Python files to check")
+        else:
+            print("\n1. Running black...")
+            black_ok = subprocess.run([sys.executable, "-m", "black", "--check", *targets]).returncode == 0
+            
+            print("\n2. Running flake8...")
+            flake8_ok = subprocess.run([sys.executable, "-m", "flake8", *targets]).returncode == 0
+            
+            success = black_ok and flake8_ok
     
     elif option == "types":
         success = run_command("mypy agents/ apis/ graph/", "Type Checking")
@@ -5,6 +5,9 @@ Pytest configuration and fixtures
 import sys
 from pathlib import Path
 
+import pytest
+import pytest_asyncio
+
 # Add parent directory to Python path so tests can import modules
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
@@ -13,3 +16,100 @@ sys.path.insert(0, str(project_root))
 import os
 os.environ.setdefault("OPENAI_API_KEY", "test-key-for-unit-tests")
 os.environ.setdefault("MAX_CODES_PER_SYSTEM", "10")
+# Keep test lookups (including stubbed ones) out of the persistent result cache
+os.environ.setdefault("QUERY_CACHE_DISK_DIR", "")
+# Likewise for API responses and term analyses, so tests exercise the
+# client and agent rather than results left on disk by earlier runs or
+# interactive sessions
+os.environ.setdefault("CLINICAL_TABLES_DISK_CACHE_DIR", "")
+os.environ.setdefault("TERMINOLOGY_DISK_CACHE_DIR", "")
+# Test terms must not end up in the developer's warm-up seed list
+os.environ.setdefault("CLINICAL_TABLES_PREFETCH_FILE", "")
+
+
+# Cassettes are only replayed unless a recording mode is asked for
+# (python scripts/run_tests.py api --record sets "all")
+VCR_RECORD_MODE = os.getenv("VCR_RECORD_MODE", "none")
+
+
+@pytest.fixture(scope="module")
+def vcr_config():
+    """Cassette settings for tests marked with @pytest.mark.vcr (pytest-recording)"""
+    return {
+        "record_mode": VCR_RECORD_MODE,
+        "match_on": ["method", "scheme", "host", "path", "query"],
+        "filter_headers": ["authorization"]
+    }
+
+
+@pytest.fixture(autouse=True)
+def require_cassette(request):
+    """
+    Skip vcr-marked tests that have nothing to replay
+    
+    In replay mode there is no network access, so a test whose cassette has
+    not been recorded (or a run without pytest-recording) is skipped rather
+    than failing or silently going to the live API.
+    """
+    if VCR_RECORD_MODE != "none" or request.node.get_closest_marker("vcr") is None:
+        return
+    if not request.config.pluginmanager.hasplugin("recording"):
+        pytest.skip("pytest-recording is not installed; cassettes cannot be replayed")
+    cassette = os.path.join(
+        request.getfixturevalue("vcr_cassette_dir"),
+        request.getfixturevalue("default_cassette_name") + ".yaml"
+    )
+    if not os.path.exists(cassette):
+        pytest.skip(f"No cassette recorded at {cassette}")
+
+
+@pytest.fixture(scope="session")
+def cfg():
+    """The loaded application settings, shared by tests in every module"""
+    from config import config
+    return config
+
+
+@pytest.fixture(scope="session")
+def ct_client():
+    """One ClinicalTablesClient for tests that only inspect it (never opened)"""
+    from apis.clinical_tables import ClinicalTablesClient
+    return ClinicalTablesClient()
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def clinical_tables_client():
+    """
+    One ClinicalTablesClient for the session
+    
+    Tests using it must run on the session event loop
+    (@pytest.mark.asyncio(loop_scope="session")) so the shared aiohttp
+    session and its pooled connections are reused across tests.
+    """
+    from apis.clinical_tables import ClinicalTablesClient, close_session
+    
+    async with ClinicalTablesClient() as client:
+        yield client
+    await close_session()
+
+
+@pytest.fixture(scope="session")
+def shared_lookup_system():
+    """
+    One ClinicalTermLookup per session, so agents and LLM clients are built
+    once (under xdist, once per worker, since each worker is its own session)
+    """
+    from main import ClinicalTermLookup
+    return ClinicalTermLookup()
+
+
+@pytest.fixture
+def lookup_system(shared_lookup_system):
+    """
+    The shared lookup system with pagination state reset for this test
+    
+    The query cache is kept, so terms repeated across tests are not sent to
+    the LLM again.
+    """
+    shared_lookup_system.memory.reset()
+    return shared_lookup_system